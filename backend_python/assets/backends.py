@@ -0,0 +1,318 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Protocol, Tuple
+from filelock import FileLock
+from config import settings
+
+log = logging.getLogger(__name__)
+
+ASSET_COLUMNS = (
+    "id",
+    "filename",
+    "relpath",
+    "mimetype",
+    "size",
+    "sha256",
+    "created_at",
+    "label",
+)
+
+
+class RegistryBackend(Protocol):
+    def list(self) -> List[Dict]: ...
+
+    def get(self, asset_id: str) -> Optional[Dict]: ...
+
+    def insert(self, record: Dict) -> None: ...
+
+    def insert_many(self, records: List[Dict]) -> None: ...
+
+    def delete(self, asset_id: str) -> Optional[int]: ...
+
+    def get_blob(self, sha256: str) -> Optional[Dict]: ...
+
+    def version(self) -> Optional[Hashable]: ...
+
+
+class JsonIndexBackend:
+    def __init__(self, index_path: Path, lock_path: Optional[Path] = None) -> None:
+        self.index_path = index_path
+        self.lock_path = lock_path or index_path.with_suffix(".lock")
+        self.lock = FileLock(str(self.lock_path), timeout=10)
+        self.own_write: Optional[Tuple[Hashable, Optional[Hashable]]] = None
+        self.ensure_index()
+
+    def ensure_index(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.index_path.exists():
+            self.atomic_write({"version": 1, "assets": {}})
+
+    def read(self) -> Dict:
+        if not self.index_path.exists():
+            return {"version": 1, "assets": {}}
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            log.error(f"Failed to read registry: {e}")
+            return {"version": 1, "assets": {}}
+
+    def atomic_write(self, payload: Dict) -> None:
+        tmp = None
+        try:
+            tmp = tempfile.NamedTemporaryFile(
+                "w",
+                delete=False,
+                dir=str(self.index_path.parent),
+                encoding="utf-8",
+                prefix=".tmp_registry_",
+            )
+            json.dump(payload, tmp, ensure_ascii=False, indent=2)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            tmp.close()
+            os.replace(tmp.name, self.index_path)
+            tmp = None
+        except Exception as e:
+            log.error(f"Failed to write registry: {e}")
+            raise
+        finally:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp.name)
+                except OSError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        with self.lock:
+            return list(self.read().get("assets", {}).values())
+
+    def get(self, asset_id: str) -> Optional[Dict]:
+        with self.lock:
+            return self.read().get("assets", {}).get(asset_id)
+
+    def insert(self, record: Dict) -> None:
+        self.insert_many([record])
+
+    @staticmethod
+    def blobs_of(data: Dict) -> Dict[str, Dict]:
+        if "blobs" not in data:
+            blobs: Dict[str, Dict] = {}
+            for meta in data.get("assets", {}).values():
+                blob = blobs.setdefault(
+                    meta["sha256"], {"size": meta["size"], "refcount": 0}
+                )
+                blob["refcount"] += 1
+            data["blobs"] = blobs
+        return data["blobs"]
+
+    def insert_many(self, records: List[Dict]) -> None:
+        with self.lock:
+            before = self.version()
+            data = self.read()
+            assets: Dict[str, Dict] = data.get("assets", {})
+            blobs = self.blobs_of(data)
+            for record in records:
+                assets[record["id"]] = record
+                blob = blobs.setdefault(
+                    record["sha256"], {"size": record["size"], "refcount": 0}
+                )
+                blob["refcount"] += 1
+            data["assets"] = assets
+            self.atomic_write(data)
+            self.record_write(before)
+
+    def delete(self, asset_id: str) -> Optional[int]:
+        with self.lock:
+            before = self.version()
+            data = self.read()
+            assets: Dict[str, Dict] = data.get("assets", {})
+            blobs = self.blobs_of(data)
+            meta = assets.pop(asset_id, None)
+            if meta is None:
+                return None
+            refcount = 0
+            blob = blobs.get(meta["sha256"])
+            if blob is not None:
+                refcount = blob["refcount"] = max(0, blob["refcount"] - 1)
+                if refcount == 0:
+                    blobs.pop(meta["sha256"])
+            data["assets"] = assets
+            self.atomic_write(data)
+            self.record_write(before)
+            return refcount
+
+    def get_blob(self, sha256: str) -> Optional[Dict]:
+        with self.lock:
+            return self.blobs_of(self.read()).get(sha256)
+
+    def stat_version(self) -> Optional[Hashable]:
+        try:
+            st = self.index_path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def record_write(self, before: Optional[Hashable]) -> None:
+        after = self.stat_version()
+        self.own_write = (after, before) if after is not None else None
+
+    def version(self) -> Optional[Hashable]:
+        current = self.stat_version()
+        own_write = self.own_write
+        if own_write is not None and current == own_write[0]:
+            return own_write[1]
+        return current
+
+
+class SqliteIndexBackend:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS assets (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            relpath TEXT NOT NULL,
+            mimetype TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            label TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_assets_label ON assets(label);
+        CREATE INDEX IF NOT EXISTS ix_assets_sha256 ON assets(sha256);
+        CREATE INDEX IF NOT EXISTS ix_assets_created_at ON assets(created_at);
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: Path, legacy_index: Optional[Path] = None) -> None:
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        self.writer = sqlite3.connect(
+            str(self.db_path), timeout=10, check_same_thread=False
+        )
+        self.writer.row_factory = sqlite3.Row
+        self.writer.execute("PRAGMA synchronous=NORMAL")
+        self.writer_lock = threading.Lock()
+        with FileLock(str(self.db_path.with_suffix(".lock")), timeout=30):
+            conn = self.connect()
+            conn.executescript(self.SCHEMA)
+            if legacy_index is not None and legacy_index.exists():
+                self.migrate_json(legacy_index)
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs (sha256, size, refcount) "
+                    "SELECT sha256, MAX(size), COUNT(*) FROM assets "
+                    "WHERE sha256 NOT IN (SELECT sha256 FROM blobs) GROUP BY sha256"
+                )
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def migrate_json(self, index_path: Path) -> None:
+        try:
+            with index_path.open("r", encoding="utf-8") as f:
+                assets: Dict[str, Dict] = json.load(f).get("assets", {})
+        except (json.JSONDecodeError, IOError) as e:
+            log.error(f"Failed to read legacy registry {index_path}: {e}")
+            return
+        rows = [
+            tuple(meta.get(c) for c in ASSET_COLUMNS)
+            for meta in assets.values()
+            if all(meta.get(c) is not None for c in ASSET_COLUMNS[:-1])
+        ]
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                f"INSERT OR IGNORE INTO assets ({', '.join(ASSET_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in ASSET_COLUMNS)})",
+                rows,
+            )
+        os.replace(index_path, index_path.with_name(index_path.name + ".migrated"))
+        log.info(f"Migrated {len(rows)} assets from {index_path} to {self.db_path}")
+
+    def list(self) -> List[Dict]:
+        cur = self.connect().execute("SELECT * FROM assets ORDER BY created_at")
+        return [dict(row) for row in cur.fetchall()]
+
+    def get(self, asset_id: str) -> Optional[Dict]:
+        row = (
+            self.connect()
+            .execute("SELECT * FROM assets WHERE id = ?", (asset_id,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def insert(self, record: Dict) -> None:
+        self.insert_many([record])
+
+    def insert_many(self, records: List[Dict]) -> None:
+        with self.writer_lock, self.writer as conn:
+            conn.executemany(
+                f"INSERT INTO assets ({', '.join(ASSET_COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in ASSET_COLUMNS)})",
+                [tuple(record.get(c) for c in ASSET_COLUMNS) for record in records],
+            )
+            conn.executemany(
+                "INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1) "
+                "ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+                [(record["sha256"], record["size"]) for record in records],
+            )
+
+    def delete(self, asset_id: str) -> Optional[int]:
+        with self.writer_lock, self.writer as conn:
+            row = conn.execute(
+                "SELECT sha256 FROM assets WHERE id = ?", (asset_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            sha256 = row["sha256"]
+            conn.execute("DELETE FROM assets WHERE id = ?", (asset_id,))
+            conn.execute(
+                "UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,)
+            )
+            blob = conn.execute(
+                "SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            refcount = max(0, blob["refcount"]) if blob else 0
+            if refcount == 0:
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        return refcount
+
+    def get_blob(self, sha256: str) -> Optional[Dict]:
+        row = (
+            self.connect()
+            .execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def version(self) -> Optional[Hashable]:
+        with self.writer_lock:
+            return self.writer.execute("PRAGMA data_version").fetchone()[0]
+
+
+def make_backend() -> RegistryBackend:
+    if settings.REGISTRYBACKEND == "json":
+        return JsonIndexBackend(settings.REGISTRYFILE)
+    if settings.REGISTRYBACKEND == "sqlite":
+        return SqliteIndexBackend(
+            settings.REGISTRYDBFILE, legacy_index=settings.REGISTRYFILE
+        )
+    raise ValueError(f"Unknown registry backend: {settings.REGISTRYBACKEND}")
@@ -1,17 +1,17 @@
 from __future__ import annotations
+import errno
 import hashlib
-import json
 import mimetypes
 import os
 import shutil
-import tempfile
+import threading
 import time
 import uuid
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Hashable, List, Optional
 import logging
-from filelock import FileLock
+from assets.backends import RegistryBackend, make_backend
 from config import settings
 
 log = logging.getLogger(__name__)
@@ -29,53 +29,47 @@ class Asset:
     label: Optional[str] = None
 
 
+@dataclass
+class PendingFile:
+    source: Path
+    filename: str
+    label: Optional[str] = None
+    sha256: Optional[str] = None
+
+
 class AssetRegistry:
-    def __init__(self, index_path: Path, lock_path: Optional[Path] = None) -> None:
-        self.index_path = index_path
-        self.lock_path = lock_path or index_path.with_suffix(".lock")
-        self.lock = FileLock(str(self.lock_path), timeout=10)
-        self.ensure_index()
-
-    def ensure_index(self) -> None:
-        self.index_path.parent.mkdir(parents=True, exist_ok=True)
-        if not self.index_path.exists():
-            self.atomic_write({"version": 1, "assets": {}})
-
-    def read(self) -> Dict:
-        if not self.index_path.exists():
-            return {"version": 1, "assets": {}}
-        try:
-            with self.index_path.open("r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            log.error(f"Failed to read registry: {e}")
-            return {"version": 1, "assets": {}}
-
-    def atomic_write(self, payload: Dict) -> None:
-        tmp = None
-        try:
-            tmp = tempfile.NamedTemporaryFile(
-                "w",
-                delete=False,
-                dir=str(self.index_path.parent),
-                encoding="utf-8",
-                prefix=".tmp_registry_",
-            )
-            json.dump(payload, tmp, ensure_ascii=False, indent=2)
-            tmp.flush()
-            os.fsync(tmp.fileno())
-            tmp.close()
-            os.replace(tmp.name, self.index_path)
-            tmp = None
-        except Exception as e:
-            log.error(f"Failed to write registry: {e}")
-            raise
-        finally:
-            if tmp is not None:
+    def __init__(self, backend: RegistryBackend) -> None:
+        self.backend = backend
+        self.cache: Dict[str, Asset] = {}
+        self.cache_version: Optional[Hashable] = None
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def load_cache(self) -> Dict[str, Asset]:
+        version = self.backend.version()
+        with self.cache_lock:
+            if version is not None and version == self.cache_version:
+                self.cache_hits += 1
+                return self.cache
+            self.cache_misses += 1
+            cache: Dict[str, Asset] = {}
+            for meta in self.backend.list():
                 try:
-                    os.unlink(tmp.name)
-                except OSError:
-                    pass
+                    cache[meta["id"]] = Asset(**meta)
+                except (TypeError, KeyError) as e:
+                    log.warning(f"Skipping malformed asset {meta.get('id')}: {e}")
+            self.cache = cache
+            self.cache_version = version
+            return cache
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self.cache_lock:
+            return {
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "size": len(self.cache),
+            }
 
     @staticmethod
     def sha256_file(p: Path, bufsize: int = 1024 * 1024) -> str:
@@ -89,73 +83,114 @@ class AssetRegistry:
         return h.hexdigest()
 
     def list_assets(self) -> List[Asset]:
-        with self.lock:
-            data = self.read()
-            assets: Dict[str, Dict] = data.get("assets", {})
-            out: List[Asset] = []
-            for aid, meta in assets.items():
-                try:
-                    out.append(Asset(**meta))
-                except (TypeError, KeyError) as e:
-                    log.warning(f"Skipping malformed asset {aid}: {e}")
-            return out
+        cache = self.load_cache()
+        with self.cache_lock:
+            return list(cache.values())
 
     def get_asset(self, asset_id: str) -> Optional[Asset]:
-        with self.lock:
-            data = self.read()
-            meta = data.get("assets", {}).get(asset_id)
-            if meta:
-                try:
-                    return Asset(**meta)
-                except (TypeError, KeyError) as e:
-                    log.error(f"Malformed asset metadata for {asset_id}: {e}")
-        return None
+        return self.load_cache().get(asset_id)
 
     def delete_asset(self, asset_id: str) -> bool:
-        with self.lock:
-            data = self.read()
-            assets: Dict[str, Dict] = data.get("assets", {})
-            meta = assets.get(asset_id)
-            if not meta:
-                return False
-            relpath = meta["relpath"]
-            abspath = settings.DATAPATH / relpath
+        meta = self.backend.get(asset_id)
+        if not meta:
+            return False
+        refcount = self.backend.delete(asset_id)
+        if refcount is None:
+            return False
+        with self.cache_lock:
+            self.cache.pop(asset_id, None)
+        abspath = settings.DATAPATH / meta["relpath"]
+        try:
+            parent = abspath.parent
+            abspath.unlink(missing_ok=True)
             try:
-                if abspath.exists():
-                    parent = abspath.parent
-                    abspath.unlink(missing_ok=True)
-                    try:
-                        if parent != settings.ASSETSPATH:
-                            parent.rmdir()
-                    except OSError:
-                        pass
-            except Exception as e:
-                log.error(f"Failed to delete asset file {abspath}: {e}")
-            finally:
-                assets.pop(asset_id, None)
-                data["assets"] = assets
-                self.atomic_write(data)
-                log.info(f"Deleted asset {asset_id}")
-            return True
+                if parent != settings.ASSETSPATH:
+                    parent.rmdir()
+            except OSError:
+                pass
+            if refcount == 0:
+                self.release_blob(meta["sha256"])
+        except Exception as e:
+            log.error(f"Failed to delete asset file {abspath}: {e}")
+        log.info(f"Deleted asset {asset_id}")
+        return True
+
+    @staticmethod
+    def blob_path(sha256: str) -> Path:
+        return settings.BLOBSPATH / sha256[:2] / sha256[2:]
+
+    def release_blob(self, sha256: str) -> None:
+        blob = self.blob_path(sha256)
+        blob.unlink(missing_ok=True)
+        try:
+            blob.parent.rmdir()
+        except OSError:
+            pass
+        log.debug(f"Removed unreferenced blob {sha256}")
+
+    @staticmethod
+    def link_blob(blob: Path, dest: Path) -> None:
+        try:
+            os.link(blob, dest)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copyfile(blob, dest)
 
     def add_file(
         self, source: Path, original_filename: str, label: Optional[str] = None
     ) -> Asset:
-        asset_id = str(uuid.uuid4())
-        safename = Path(original_filename).name
-        if safename != original_filename or ".." in safename or "/" in safename:
-            raise ValueError(f"Invalid filename: {original_filename}")
+        return self.add_files([PendingFile(source, original_filename, label)])[0]
+
+    def add_files(self, batch: List[PendingFile]) -> List[Asset]:
+        records: List[Asset] = []
+        try:
+            for item in batch:
+                asset_id = str(uuid.uuid4())
+                try:
+                    records.append(self.store_file(item, asset_id))
+                except Exception:
+                    shutil.rmtree(settings.ASSETSPATH / asset_id, ignore_errors=True)
+                    raise
+            self.backend.insert_many([asdict(r) for r in records])
+        except Exception:
+            for record in records:
+                shutil.rmtree(settings.ASSETSPATH / record.id, ignore_errors=True)
+                if self.backend.get_blob(record.sha256) is None:
+                    self.release_blob(record.sha256)
+            raise
+        with self.cache_lock:
+            for record in records:
+                self.cache[record.id] = record
+        for record in records:
+            log.info(
+                f"Added asset {record.id}: {record.filename} (label: {record.label})"
+            )
+        return records
+
+    def store_file(self, item: PendingFile, asset_id: str) -> Asset:
+        safename = Path(item.filename).name
+        if safename != item.filename or ".." in safename or "/" in safename:
+            raise ValueError(f"Invalid filename: {item.filename}")
         asset_dir = settings.ASSETSPATH / asset_id
         asset_dir.mkdir(parents=True, exist_ok=True)
         dest = asset_dir / safename
         if not dest.resolve().is_relative_to(settings.ASSETSPATH.resolve()):
             raise PermissionError("Attempted path traversal")
-        shutil.move(str(source), str(dest))
-        size = dest.stat().st_size
-        sha256 = self.sha256_file(dest)
+        size = item.source.stat().st_size
+        sha256 = item.sha256 or self.sha256_file(item.source)
+        blob = self.blob_path(sha256)
+        try:
+            self.link_blob(blob, dest)
+            item.source.unlink(missing_ok=True)
+            log.info(f"Deduplicated {safename} against blob {sha256}")
+        except FileNotFoundError:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(item.source), str(blob))
+            self.link_blob(blob, dest)
         mimetype = mimetypes.guess_type(dest.name)[0] or "application/octet-stream"
         relpath = dest.relative_to(settings.DATAPATH).as_posix()
-        record = Asset(
+        return Asset(
             id=asset_id,
             filename=safename,
             relpath=relpath,
@@ -163,16 +198,8 @@ class AssetRegistry:
             size=size,
             sha256=sha256,
             created_at=time.time(),
-            label=label,
+            label=item.label,
         )
-        with self.lock:
-            data = self.read()
-            assets: Dict[str, Dict] = data.get("assets", {})
-            assets[asset_id] = asdict(record)
-            data["assets"] = assets
-            self.atomic_write(data)
-        log.info(f"Added asset {asset_id}: {safename} (label: {label})")
-        return record
 
     def resolve_path(self, asset: Asset) -> Path:
         abspath = (settings.DATAPATH / asset.relpath).resolve()
@@ -184,4 +211,4 @@ class AssetRegistry:
         return abspath
 
 
-registry = AssetRegistry(settings.REGISTRYFILE)
+registry = AssetRegistry(make_backend())
@@ -13,6 +13,11 @@ api_key_header = APIKeyHeader(name=settings.API_KEY_HEADER, auto_error=False)
 log = logging.getLogger(__name__)
 
 
+@router.get("/cache/stats")
+async def cache_stats(key: Annotated[str, Security(verify_api_key)]) -> dict:
+    return registry.cache_stats()
+
+
 @router.get("/{asset_id}")
 async def get_asset(
     asset_id: str, key: Annotated[str, Security(verify_api_key)]
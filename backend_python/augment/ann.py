@@ -0,0 +1,115 @@
+from __future__ import annotations
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .cache import ArrayStore
+from .smote import sq_distances
+from config import settings
+
+log = logging.getLogger(__name__)
+IVF_ITERATIONS = 10
+Fetch = Callable[[np.ndarray], np.ndarray]
+
+
+def nearest_lists(
+    fetch: Fetch, n: int, centroids: np.ndarray, block: int
+) -> np.ndarray:
+    assign = np.empty(n, dtype=np.int64)
+    for start in range(0, n, block):
+        positions = np.arange(start, min(start + block, n))
+        assign[positions] = np.argmin(sq_distances(fetch(positions), centroids), axis=1)
+    return assign
+
+
+def kmeans(
+    fetch: Fetch, n: int, nlist: int, randomstate: Optional[int], block: int
+) -> np.ndarray:
+    rng = np.random.RandomState(randomstate)
+    centroids = fetch(np.sort(rng.choice(n, nlist, replace=False)))
+    for _ in range(IVF_ITERATIONS):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(nlist, dtype=np.int64)
+        for start in range(0, n, block):
+            b = fetch(np.arange(start, min(start + block, n)))
+            assign = np.argmin(sq_distances(b, centroids), axis=1)
+            np.add.at(sums, assign, b)
+            counts += np.bincount(assign, minlength=nlist)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, centroids: np.ndarray, assign: np.ndarray) -> None:
+        self.centroids = centroids
+        self.order = np.argsort(assign, kind="stable")
+        self.bounds = np.searchsorted(assign[self.order], np.arange(len(centroids) + 1))
+
+    def members(self, lists: Tuple[int, ...]) -> np.ndarray:
+        return np.concatenate(
+            [self.order[self.bounds[c] : self.bounds[c + 1]] for c in lists]
+        )
+
+    def search(
+        self,
+        fetch: Fetch,
+        queries: np.ndarray,
+        k: int,
+        nprobe: int,
+        exclude: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        n = len(self.order)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(
+            sq_distances(queries, self.centroids), nprobe - 1, axis=1
+        )
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for i, lists in enumerate(np.sort(probes[:, :nprobe], axis=1)):
+            groups.setdefault(tuple(lists.tolist()), []).append(i)
+        result = np.empty((len(queries), k), dtype=np.int64)
+        needed = k + (exclude is not None)
+        for lists, qi in groups.items():
+            candidates = self.members(lists)
+            if len(candidates) < needed:
+                candidates = np.arange(n)
+            d = sq_distances(queries[qi], fetch(candidates))
+            if exclude is not None:
+                d[exclude[qi][:, None] == candidates[None, :]] = np.inf
+            part = np.argpartition(d, k - 1, axis=1)[:, :k]
+            order = np.argsort(np.take_along_axis(d, part, axis=1), axis=1)
+            result[qi] = candidates[np.take_along_axis(part, order, axis=1)]
+        return result
+
+
+def list_count(n: int, requested: int) -> int:
+    return max(1, min(n, requested or int(math.sqrt(n))))
+
+
+def load_index(
+    fetch: Fetch,
+    n: int,
+    dim: int,
+    nlist: int,
+    randomstate: Optional[int],
+    key: Optional[str],
+    tag: str,
+    block: int,
+) -> IVFIndex:
+    name = f"{key}_{dim}x{nlist}_{tag}"
+    centroids = None
+    if key:
+        cached = index_cache.get(name)
+        if cached is not None:
+            centroids = np.array(cached, dtype=np.float64)
+    if centroids is None:
+        log.info(f"Building {nlist}-list IVF index over {n} vectors")
+        centroids = kmeans(fetch, n, nlist, randomstate, block)
+        if key:
+            index_cache.put(name, centroids)
+    return IVFIndex(centroids, nearest_lists(fetch, n, centroids, block))
+
+
+index_cache = ArrayStore(
+    settings.CACHEPATH / "indexes", settings.INDEXCACHEMB * 1024 * 1024
+)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+from config import settings
+
+log = logging.getLogger(__name__)
+EVICT_TARGET = 0.9
+
+
+class ArrayStore:
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total: Optional[int] = None
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str) -> Path:
+        return self.root / name[:2] / f"{name}.npy"
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        if self.max_bytes <= 0:
+            return None
+        p = self.path(name)
+        try:
+            arr = np.load(p, mmap_mode="r")
+            os.utime(p)
+            return arr
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log.warning(f"Dropping unreadable cache entry {p}: {e}")
+            p.unlink(missing_ok=True)
+            return None
+
+    def put(self, name: str, arr: np.ndarray) -> None:
+        if self.max_bytes <= 0:
+            return
+        p = self.path(name)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(
+            delete=False, dir=str(p.parent), prefix=".tmp_", suffix=".npy"
+        )
+        try:
+            with tmp:
+                np.save(tmp, arr)
+            size = os.path.getsize(tmp.name)
+            try:
+                size -= p.stat().st_size
+            except FileNotFoundError:
+                pass
+            os.replace(tmp.name, p)
+        except Exception as e:
+            log.warning(f"Failed to write cache entry {p}: {e}")
+            try:
+                os.unlink(tmp.name)
+            except OSError:
+                pass
+            return
+        with self.lock:
+            if self.total is not None:
+                self.total += size
+            over = self.total is None or self.total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        with self.lock:
+            entries = []
+            total = 0
+            for p in self.root.glob("*/*.npy"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+            if total > self.max_bytes:
+                entries.sort()
+                target = int(self.max_bytes * EVICT_TARGET)
+                removed = 0
+                for _, size, p in entries:
+                    if total <= target:
+                        break
+                    p.unlink(missing_ok=True)
+                    total -= size
+                    removed += 1
+                log.info(f"Evicted {removed} entries from {self.root.name} cache")
+            self.total = total
+
+
+class PreprocessCache:
+    def __init__(self, store: ArrayStore) -> None:
+        self.store = store
+
+    @staticmethod
+    def name(sha256: str, size: Tuple[int, int], mode: str) -> str:
+        width, height = size
+        return f"{sha256}_{width}x{height}_{mode}"
+
+    def get(
+        self, sha256: str, size: Tuple[int, int], mode: str
+    ) -> Optional[np.ndarray]:
+        return self.store.get(self.name(sha256, size, mode))
+
+    def put(
+        self, sha256: str, size: Tuple[int, int], mode: str, arr: np.ndarray
+    ) -> None:
+        self.store.put(self.name(sha256, size, mode), arr)
+
+
+preprocess_cache = PreprocessCache(
+    ArrayStore(
+        settings.CACHEPATH / "preprocessed", settings.PREPROCESSCACHEMB * 1024 * 1024
+    )
+)
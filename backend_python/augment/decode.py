@@ -0,0 +1,45 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+from PIL import Image
+
+DECODE_VERSION = 1
+
+
+def _validate_image(im: Image.Image) -> None:
+    if im.mode not in ["RGB", "L", "RGBA", "P"]:
+        raise ValueError(
+            f"Unsupported mode; expected RGB, L, RGBA, or P, got {im.mode}"
+        )
+
+
+def decode_tag(mode: str, reducing_gap: Optional[float]) -> str:
+    return f"{mode}_g{reducing_gap or 0:g}_v{DECODE_VERSION}"
+
+
+def draft(
+    im: Image.Image, size: Tuple[int, int], mode: str, reducing_gap: Optional[float]
+) -> None:
+    if not reducing_gap or im.format != "JPEG" or im.mode not in ("RGB", "L"):
+        return
+    im.draft(mode, (int(size[0] * reducing_gap), int(size[1] * reducing_gap)))
+
+
+def preprocess(
+    im: Image.Image,
+    size: Tuple[int, int],
+    mode: str = "RGB",
+    reducing_gap: Optional[float] = None,
+) -> Optional[Image.Image]:
+    draft(im, size, mode, reducing_gap)
+    _validate_image(im)
+    if im.mode == "RGBA":
+        background = Image.new("RGB", im.size, (255, 255, 255))
+        background.paste(im, mask=im.split()[3])
+        im = background
+    elif im.mode == "P":
+        im = im.convert("RGB")
+    elif im.mode not in ("RGB", "L"):
+        return None
+    if im.mode != mode:
+        im = im.convert(mode)
+    return im.resize(size, Image.LANCZOS, reducing_gap=reducing_gap)
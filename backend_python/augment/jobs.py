@@ -0,0 +1,261 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from augment.pipeline import augment_dataset, write_zip
+from augment.results import result_cache
+from augment.schemas import ImageInfo, JobState
+from augment.service import load_params
+from config import settings
+
+log = logging.getLogger(__name__)
+CLEANUP_INTERVAL = 3600
+
+
+def job_owner(api_key: Optional[str]) -> str:
+    if not api_key:
+        return "anonymous"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def process_start(pid: int) -> Optional[str]:
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def pid_alive(pid: int, started: Optional[str]) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    current = process_start(pid)
+    return started is None or current is None or current == started
+
+
+PROCESS_START = process_start(os.getpid())
+
+
+class JobQueue:
+    def __init__(
+        self,
+        root: Path,
+        workers: int,
+        max_queued: int,
+        retention: int,
+        max_kept: int,
+    ) -> None:
+        self.root = root
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.retention = retention
+        self.max_kept = max_kept
+        self.cond = threading.Condition()
+        self.queues: Dict[str, Deque[Tuple[str, List[ImageInfo]]]] = {}
+        self.owners: Deque[str] = deque()
+        self.threads: List[threading.Thread] = []
+
+    def job_dir(self, job_id: str) -> Optional[Path]:
+        try:
+            return self.root / uuid.UUID(job_id).hex
+        except ValueError:
+            return None
+
+    def result_path(self, job_id: str) -> Optional[Path]:
+        job_dir = self.job_dir(job_id)
+        return job_dir / "result.zip" if job_dir else None
+
+    def save(self, state: JobState) -> None:
+        job_dir = self.job_dir(state.id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", delete=False, dir=str(job_dir), encoding="utf-8", prefix=".tmp_state_"
+        ) as tmp:
+            json.dump(state.model_dump(), tmp, ensure_ascii=False, indent=2)
+            tmp_name = tmp.name
+        os.replace(tmp_name, job_dir / "state.json")
+
+    def load(self, job_id: str) -> Optional[JobState]:
+        job_dir = self.job_dir(job_id)
+        if job_dir is None:
+            return None
+        try:
+            with (job_dir / "state.json").open("r", encoding="utf-8") as f:
+                return JobState(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            log.error(f"Failed to read job state {job_id}: {e}")
+            return None
+
+    def status(self, job_id: str) -> Optional[JobState]:
+        state = self.load(job_id)
+        if (
+            state
+            and state.status in ("queued", "running")
+            and not pid_alive(state.pid, state.pid_started)
+        ):
+            state.status = "failed"
+            state.error = "Job interrupted by a worker restart"
+            state.finished_at = time.time()
+            state.expires_at = state.finished_at + self.retention
+            self.save(state)
+        return state
+
+    def cleanup(self) -> None:
+        finished = []
+        now = time.time()
+        for state_path in self.root.glob("*/state.json"):
+            state = self.status(state_path.parent.name)
+            if state is None or state.status not in ("done", "failed"):
+                continue
+            finished_at = state.finished_at or state.created_at
+            if (state.expires_at or finished_at + self.retention) <= now:
+                self.remove(state.id)
+            else:
+                finished.append((finished_at, state.id))
+        finished.sort()
+        for _, job_id in finished[: max(0, len(finished) - self.max_kept)]:
+            self.remove(job_id)
+
+    def remove(self, job_id: str) -> None:
+        job_dir = self.job_dir(job_id)
+        if job_dir is not None:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            log.info(f"Removed finished augmentation job {job_id}")
+
+    def submit(self, owner: str, images: List[ImageInfo]) -> JobState:
+        with self.cond:
+            queued = sum(len(q) for q in self.queues.values())
+            if queued >= self.max_queued:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many queued augmentation jobs, retry later",
+                    headers={"Retry-After": str(settings.EXECUTORRETRYAFTER)},
+                )
+            state = JobState(
+                id=uuid.uuid4().hex,
+                owner=owner,
+                created_at=time.time(),
+                pid=os.getpid(),
+                pid_started=PROCESS_START,
+            )
+            self.save(state)
+            if owner not in self.queues:
+                self.queues[owner] = deque()
+                self.owners.append(owner)
+            self.queues[owner].append((state.id, images))
+            self.ensure_workers()
+            self.cond.notify()
+        log.info(f"Queued augmentation job {state.id} with {len(images)} images")
+        return state
+
+    def ensure_workers(self) -> None:
+        self.threads = [t for t in self.threads if t.is_alive()]
+        while len(self.threads) < self.workers:
+            t = threading.Thread(target=self.work, name="augment-job", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def next_job(self) -> Optional[Tuple[str, List[ImageInfo]]]:
+        with self.cond:
+            while not self.owners:
+                if not self.cond.wait(timeout=CLEANUP_INTERVAL):
+                    return None
+            owner = self.owners.popleft()
+            job = self.queues[owner].popleft()
+            if self.queues[owner]:
+                self.owners.append(owner)
+            else:
+                del self.queues[owner]
+            return job
+
+    def work(self) -> None:
+        while True:
+            job = self.next_job()
+            if job is None:
+                self.cleanup()
+                continue
+            job_id, images = job
+            try:
+                self.execute(job_id, images)
+            except Exception as e:
+                log.exception(f"Augmentation job {job_id} crashed: {e}")
+
+    def execute(self, job_id: str, images: List[ImageInfo]) -> None:
+        state = self.load(job_id)
+        if state is None:
+            log.error(f"Job {job_id} disappeared before it started")
+            return
+        state.status = "running"
+        state.started_at = time.time()
+        self.save(state)
+
+        def progress(fraction: float) -> None:
+            percent = round(100 * min(max(fraction, 0.0), 1.0), 1)
+            if percent >= state.progress + 1:
+                state.progress = percent
+                self.save(state)
+
+        try:
+            result_path = self.result_path(job_id)
+            tmp_path = result_path.with_suffix(".tmp")
+            cache_key = result_cache.key(images, load_params())
+            cached = result_cache.get(cache_key) if cache_key else None
+            if cached:
+                log.info(f"Job {job_id} reuses cached SMOTE result {cache_key}")
+                with cached[0] as src, open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                count = cached[1]["count"]
+            else:
+                result, response_json = augment_dataset(
+                    images, state.owner, progress=progress
+                )
+                with open(tmp_path, "wb") as f:
+                    write_zip(f, response_json, result)
+                count = len(result.synthetics)
+                if cache_key:
+                    meta = {"count": count, "report": response_json}
+                    result_cache.put_file(cache_key, tmp_path, meta)
+            os.replace(tmp_path, result_path)
+            state.status = "done"
+            state.progress = 100.0
+            state.count = count
+        except HTTPException as e:
+            state.status = "failed"
+            state.error = str(e.detail)
+        except Exception as e:
+            log.error(f"Augmentation job {job_id} failed: {e}", exc_info=True)
+            state.status = "failed"
+            state.error = "Augmentation failed"
+        finally:
+            state.finished_at = time.time()
+            state.expires_at = state.finished_at + self.retention
+            self.save(state)
+        log.info(f"Augmentation job {job_id} finished with status {state.status}")
+        self.cleanup()
+
+
+job_queue = JobQueue(
+    settings.JOBSPATH,
+    settings.JOBWORKERS,
+    settings.JOBMAXQUEUED,
+    settings.JOBRETENTIONSECONDS,
+    settings.JOBMAXKEPT,
+)
+job_queue.cleanup()
@@ -0,0 +1,237 @@
+from __future__ import annotations
+import io
+import json
+import logging
+import math
+import zipfile
+from collections import Counter
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, Optional
+from fastapi import HTTPException
+from augment.schemas import ImageInfo, ImageRef, SyntheticImages
+from augment.service import run_smote
+from assets.registry import registry
+from metrics.schemas import MetricsReport
+from metrics.service import compute_quality_metrics
+
+log = logging.getLogger(__name__)
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+STORED_SUFFIXES = IMAGE_SUFFIXES
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.959964
+
+
+def resolve_images(refs: List[ImageRef]) -> List[ImageInfo]:
+    images_with_labels: List[ImageInfo] = []
+    for imgref in refs:
+        asset = registry.get_asset(imgref.asset_id)
+        if not asset:
+            raise HTTPException(
+                status_code=404, detail=f"Asset {imgref.asset_id} not found"
+            )
+        if not asset.label:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Asset {imgref.asset_id} has no class label. Upload images using nested ZIP structure: class_name/image.jpg",
+            )
+        path = registry.resolve_path(asset)
+        images_with_labels.append(
+            ImageInfo(path=path, label=asset.label, sha256=asset.sha256)
+        )
+    return images_with_labels
+
+
+def augment_dataset(
+    images: List[ImageInfo],
+    scope: str,
+    progress: Optional[Callable[[float], None]] = None,
+) -> tuple[SyntheticImages, dict]:
+    report = progress or (lambda fraction: None)
+    log.info(f"Running SMOTE on {len(images)} images")
+    result = run_smote(images, scope, progress=lambda f: report(0.7 * f))
+    if not result.synthetics:
+        raise HTTPException(
+            status_code=400,
+            detail="No synthetic images generated. Check class distribution and parameters.",
+        )
+    log.info(f"Computing quality metrics for {len(result.synthetics)} synthetic images")
+    metrics_report = compute_quality_metrics(
+        result, progress=lambda f: report(0.7 + 0.25 * f)
+    )
+    result.features = None
+    return result, build_report(result, metrics_report)
+
+
+def build_report(result: SyntheticImages, metrics_report: MetricsReport) -> dict:
+    synthetic_images_json = [
+        {
+            "filename": synthinfo.path.name,
+            "class": synthinfo.label,
+            "format": synthinfo.path.suffix.lstrip(".").lower(),
+            "url": (
+                f"/assets/synthetic/{synthinfo.label}/{synthinfo.path.name}"
+                if synthinfo.path.suffix.lower() in IMAGE_SUFFIXES
+                else None
+            ),
+        }
+        for synthinfo in result.synthetics
+    ]
+    original_counts = Counter(o.label for o in result.originals)
+    synthetic_counts = Counter(s.label for s in result.synthetics)
+    all_labels = set(original_counts.keys()) | set(synthetic_counts.keys())
+    classes = {
+        label: {
+            "original_count": original_counts.get(label, 0),
+            "synthetic_count": synthetic_counts.get(label, 0),
+            "total_count": original_counts.get(label, 0)
+            + synthetic_counts.get(label, 0),
+        }
+        for label in sorted(all_labels)
+    }
+    quality_metrics = [
+        {
+            "synthetic_image": metric.synthpath.name,
+            "cosine_similarity": round(metric.cossim, 4),
+            "ssim": round(metric.ssim, 4),
+        }
+        for metric in metrics_report.metrics
+    ]
+    avg_cos = (
+        round(
+            sum(m["cosine_similarity"] for m in quality_metrics) / len(quality_metrics),
+            4,
+        )
+        if quality_metrics
+        else 0.0
+    )
+    avg_ssim = (
+        round(sum(m["ssim"] for m in quality_metrics) / len(quality_metrics), 4)
+        if quality_metrics
+        else 0.0
+    )
+    metrics = {
+        "total_synthetic_images": len(result.synthetics),
+        "total_original_images": len(result.originals),
+        "classes": classes,
+        "quality_metrics": quality_metrics,
+        "average_quality": {"cosine_similarity": avg_cos, "ssim": avg_ssim},
+    }
+    if result.neighbor_search is not None:
+        metrics["neighbor_search"] = result.neighbor_search.model_dump()
+    if metrics_report.truncated:
+        metrics["quality_sampling"] = quality_sampling(metrics_report)
+    return {
+        "count": len(result.synthetics),
+        "synthetic_images": synthetic_images_json,
+        "metrics": metrics,
+    }
+
+
+def confidence_interval(values: List[float], total: int) -> Optional[List[float]]:
+    n = len(values)
+    if n < 2:
+        return None
+    mean = sum(values) / n
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+    correction = (total - n) / (total - 1) if total > n else 0.0
+    half = CONFIDENCE_Z * math.sqrt(variance / n * correction)
+    return [round(mean - half, 4), round(mean + half, 4)]
+
+
+def quality_sampling(metrics_report: MetricsReport) -> dict:
+    evaluated = metrics_report.metrics
+    return {
+        "mode": metrics_report.mode,
+        "evaluated": len(evaluated),
+        "total": metrics_report.total,
+        "confidence": CONFIDENCE_LEVEL,
+        "cosine_similarity_ci": confidence_interval(
+            [m.cossim for m in evaluated], metrics_report.total
+        ),
+        "ssim_ci": confidence_interval(
+            [m.ssim for m in evaluated], metrics_report.total
+        ),
+    }
+
+
+class ZipChunkSink(io.RawIOBase):
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+
+def add_zip_entries(
+    zipf: zipfile.ZipFile, response_json: dict, result: SyntheticImages
+) -> Iterator[None]:
+    zipf.writestr(
+        "augmentation_metadata.json",
+        json.dumps(response_json, indent=2),
+        compress_type=zipfile.ZIP_DEFLATED,
+    )
+    log.info("Added metadata JSON to ZIP")
+    yield
+    log.info("Adding original images to ZIP")
+    for orig_info in result.originals:
+        if add_zip_file(zipf, orig_info):
+            log.debug(f"Added original: {orig_info.label}/{orig_info.path.name}")
+            yield
+    log.info("Adding synthetic images to ZIP")
+    for synth_info in result.synthetics:
+        if add_zip_file(zipf, synth_info):
+            log.debug(f"Added synthetic: {synth_info.label}/{synth_info.path.name}")
+            yield
+
+
+def add_zip_file(zipf: zipfile.ZipFile, info: ImageInfo) -> bool:
+    path = Path(info.path)
+    if not path.exists():
+        return False
+    compress_type = (
+        zipfile.ZIP_STORED
+        if path.suffix.lower() in STORED_SUFFIXES
+        else zipfile.ZIP_DEFLATED
+    )
+    zipf.write(path, f"{info.label}/{path.name}", compress_type=compress_type)
+    return True
+
+
+def write_zip(fp: BinaryIO, response_json: dict, result: SyntheticImages) -> None:
+    log.info("Creating ZIP file with augmented dataset")
+    with zipfile.ZipFile(fp, "w") as zipf:
+        for _ in add_zip_entries(zipf, response_json, result):
+            pass
+
+
+def iter_zip(response_json: dict, result: SyntheticImages) -> Iterator[bytes]:
+    log.info("Streaming ZIP file with augmented dataset")
+    sink = ZipChunkSink()
+    size = 0
+    try:
+        with zipfile.ZipFile(sink, "w") as zipf:
+            for _ in add_zip_entries(zipf, response_json, result):
+                for chunk in sink.drain():
+                    size += len(chunk)
+                    yield chunk
+        for chunk in sink.drain():
+            size += len(chunk)
+            yield chunk
+    except Exception as e:
+        log.error(f"Failed to stream ZIP file: {e}", exc_info=True)
+        raise
+    log.info(f"ZIP file streamed successfully, size: {size} bytes")
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import hashlib
+import logging
+from typing import List, Optional
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+from sklearn.random_projection import SparseRandomProjection
+from sklearn.utils import gen_batches
+from sklearn.utils.extmath import safe_sparse_dot
+from .cache import ArrayStore
+from config import settings
+
+log = logging.getLogger(__name__)
+
+
+class Reducer:
+    def __init__(self, components, mean: Optional[np.ndarray] = None) -> None:
+        self.components = components
+        self.mean = mean
+
+    def transform(self, block: np.ndarray) -> np.ndarray:
+        if self.mean is not None:
+            block = block - self.mean
+        return np.asarray(safe_sparse_dot(block, self.components.T), dtype=np.float32)
+
+
+def dataset_key(shas: List[Optional[str]], shape: tuple) -> Optional[str]:
+    if not shas or not all(shas):
+        return None
+    h = hashlib.sha256(repr(shape).encode("utf-8"))
+    for sha in sorted(shas):
+        h.update(sha.encode("utf-8"))
+    return h.hexdigest()
+
+
+def fit_pca(X: np.ndarray, dims: int, block: int) -> Reducer:
+    pca = IncrementalPCA(n_components=dims)
+    for batch in gen_batches(len(X), max(block, dims), min_batch_size=dims):
+        pca.partial_fit(X[batch].astype(np.float32))
+    return Reducer(pca.components_.astype(np.float32), pca.mean_.astype(np.float32))
+
+
+def fit_projection(X: np.ndarray, dims: int, randomstate: Optional[int]) -> Reducer:
+    srp = SparseRandomProjection(n_components=dims, random_state=randomstate)
+    srp.fit(X[:1])
+    return Reducer(srp.components_)
+
+
+def load_reducer(
+    X: np.ndarray,
+    mode: str,
+    dims: int,
+    randomstate: Optional[int],
+    key: Optional[str],
+    block: int,
+) -> Reducer:
+    if mode == "projection":
+        return fit_projection(X, dims, randomstate)
+    dims = min(dims, len(X), X.shape[1])
+    name = f"{key}_{X.shape[1]}x{dims}_pca"
+    if key:
+        cached = reducer_cache.get(name)
+        if cached is not None:
+            return Reducer(np.asarray(cached[1:]), np.asarray(cached[0]))
+    log.info(f"Fitting {dims}-component PCA on {len(X)} originals")
+    reducer = fit_pca(X, dims, block)
+    if key:
+        reducer_cache.put(name, np.vstack([reducer.mean, reducer.components]))
+    return reducer
+
+
+def embed(X: np.ndarray, reducer: Reducer, block: int) -> np.ndarray:
+    out = None
+    for start in range(0, len(X), block):
+        part = reducer.transform(X[start : start + block].astype(np.float32))
+        if out is None:
+            out = np.empty((len(X), part.shape[1]), dtype=np.float32)
+        out[start : start + len(part)] = part
+    return out
+
+
+reducer_cache = ArrayStore(
+    settings.CACHEPATH / "reducers", settings.REDUCERCACHEMB * 1024 * 1024
+)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+from .decode import decode_tag
+from .schemas import ImageInfo, ParameterSet
+from config import settings
+
+log = logging.getLogger(__name__)
+RESULT_CHUNK_BYTES = 1024 * 1024
+
+
+class ResultCache:
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, images: List[ImageInfo], params: ParameterSet) -> Optional[str]:
+        if self.max_bytes <= 0 or params.randomstate is None:
+            return None
+        if not images or not all(info.sha256 for info in images):
+            return None
+        config = {
+            "images": sorted(
+                [info.sha256, info.label, Path(info.path).name] for info in images
+            ),
+            "params": params.model_dump(),
+            "codec": [
+                settings.SYNTHETICCODEC,
+                settings.PNGCOMPRESSLEVEL,
+                settings.WEBPEFFORT,
+            ],
+            "decode": decode_tag(params.channelmode, settings.DECODEREDUCINGGAP),
+        }
+        encoded = json.dumps(config, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Tuple[BinaryIO, dict]]:
+        entry = self.entry(key)
+        try:
+            handle = (entry / "result.zip").open("rb")
+        except FileNotFoundError:
+            return None
+        try:
+            with (entry / "meta.json").open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(entry / "result.zip")
+        except FileNotFoundError:
+            handle.close()
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            handle.close()
+            log.warning(f"Dropping unreadable result cache entry {key}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        return handle, meta
+
+    def stream(self, handle: BinaryIO) -> Iterator[bytes]:
+        with handle:
+            while chunk := handle.read(RESULT_CHUNK_BYTES):
+                yield chunk
+
+    def tee(self, key: str, chunks: Iterator[bytes], meta: dict) -> Iterator[bytes]:
+        entry = self.entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(
+            delete=False, dir=str(entry.parent), prefix=".tmp_", suffix=".zip"
+        )
+        completed = False
+        try:
+            with tmp:
+                for chunk in chunks:
+                    tmp.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                self.commit(key, Path(tmp.name), meta)
+            else:
+                Path(tmp.name).unlink(missing_ok=True)
+
+    def put_file(self, key: str, path: Path, meta: dict) -> None:
+        entry = self.entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.parent / f".tmp_{key}.zip"
+        try:
+            os.link(path, tmp)
+        except OSError:
+            shutil.copyfile(path, tmp)
+        self.commit(key, tmp, meta)
+
+    def commit(self, key: str, zip_tmp: Path, meta: dict) -> None:
+        entry = self.entry(key)
+        try:
+            entry.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", delete=False, dir=str(entry), encoding="utf-8", prefix=".tmp_"
+            ) as tmp:
+                json.dump(meta, tmp)
+                meta_tmp = tmp.name
+            os.replace(zip_tmp, entry / "result.zip")
+            os.replace(meta_tmp, entry / "meta.json")
+            log.info(f"Cached SMOTE result {key}")
+        except Exception as e:
+            log.warning(f"Failed to cache SMOTE result {key}: {e}")
+            zip_tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        for zip_path in self.root.glob("*/*/result.zip"):
+            try:
+                st = zip_path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, zip_path.parent))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        log.info(f"Evicted {removed} cached SMOTE results")
+
+
+result_cache = ResultCache(
+    settings.CACHEPATH / "results", settings.RESULTCACHEMB * 1024 * 1024
+)
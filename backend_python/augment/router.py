@@ -1,15 +1,16 @@
 from __future__ import annotations
 import logging
-from typing import Annotated, List
-from fastapi import APIRouter, HTTPException, Security, Response
-from fastapi.responses import JSONResponse
-from fastapi.security import APIKeyHeader
-from augment.schemas import AugmentRequest, ImageInfo
-from augment.service import run_smote
-from assets.registry import registry
-from config import settings
-from metrics.service import compute_quality_metrics
+import os
+from typing import Annotated
+from fastapi import APIRouter, HTTPException, Security
+from fastapi.responses import FileResponse, StreamingResponse
+from augment.jobs import job_owner, job_queue
+from augment.pipeline import augment_dataset, iter_zip, resolve_images
+from augment.results import result_cache
+from augment.schemas import AugmentRequest
+from augment.service import load_params
 from auth import verify_api_key
+from executor import cpu_executor
 
 router = APIRouter(prefix="/augment", tags=["augment"])
 log = logging.getLogger(__name__)
@@ -19,126 +20,76 @@ log = logging.getLogger(__name__)
 async def post_smote(
     req: AugmentRequest, key: Annotated[str, Security(verify_api_key)]
 ):
-    images_with_labels: List[ImageInfo] = []
-    for imgref in req.images:
-        asset = registry.get_asset(imgref.asset_id)
-        if not asset:
-            raise HTTPException(
-                status_code=404, detail=f"Asset {imgref.asset_id} not found"
-            )
-        if not asset.label:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Asset {imgref.asset_id} has no class label. Upload images using nested ZIP structure: class_name/image.jpg",
-            )
-        path = registry.resolve_path(asset)
-        images_with_labels.append(ImageInfo(path=path, label=asset.label))
-    log.info(f"Running SMOTE on {len(images_with_labels)} images")
-    result = run_smote(images_with_labels)
-    if not result.synthetics:
-        raise HTTPException(
-            status_code=400,
-            detail="No synthetic images generated. Check class distribution and parameters.",
-        )
-    log.info(f"Computing quality metrics for {len(result.synthetics)} synthetic images")
-    metrics_report = compute_quality_metrics(result)
-    synthetic_images_json = [
-        {
-            "filename": synthinfo.path.name,
-            "class": synthinfo.label,
-            "url": f"/assets/synthetic/{synthinfo.label}/{synthinfo.path.name}",
-        }
-        for synthinfo in result.synthetics
-    ]
-    from collections import Counter
+    return await cpu_executor.run("smote", smote_response, req, job_owner(key))
 
-    original_counts = Counter(o.label for o in result.originals)
-    synthetic_counts = Counter(s.label for s in result.synthetics)
-    all_labels = set(original_counts.keys()) | set(synthetic_counts.keys())
-    classes = {
-        label: {
-            "original_count": original_counts.get(label, 0),
-            "synthetic_count": synthetic_counts.get(label, 0),
-            "total_count": original_counts.get(label, 0)
-            + synthetic_counts.get(label, 0),
-        }
-        for label in sorted(all_labels)
+
+@router.post("/jobs", status_code=202)
+def submit_smote_job(
+    req: AugmentRequest, key: Annotated[str, Security(verify_api_key)]
+) -> dict:
+    images_with_labels = resolve_images(req.images)
+    job = job_queue.submit(job_owner(key), images_with_labels)
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/augment/jobs/{job.id}",
+        "result_url": f"/augment/jobs/{job.id}/result",
     }
-    quality_metrics = [
-        {
-            "synthetic_image": metric.synthpath.name,
-            "cosine_similarity": round(metric.cossim, 4),
-            "ssim": round(metric.ssim, 4),
-        }
-        for metric in metrics_report.metrics
-    ]
-    avg_cos = (
-        round(
-            sum(m["cosine_similarity"] for m in quality_metrics) / len(quality_metrics),
-            4,
+
+
+@router.get("/jobs/{job_id}")
+def get_smote_job(job_id: str, key: Annotated[str, Security(verify_api_key)]) -> dict:
+    job = job_queue.status(job_id)
+    if not job or job.owner != job_owner(key):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.model_dump(exclude={"owner", "pid", "pid_started"})
+
+
+@router.get("/jobs/{job_id}/result")
+def get_smote_job_result(
+    job_id: str, key: Annotated[str, Security(verify_api_key)]
+) -> FileResponse:
+    job = job_queue.status(job_id)
+    if not job or job.owner != job_owner(key):
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409, detail=f"Job is {job.status}, result not available"
         )
-        if quality_metrics
-        else 0.0
-    )
-    avg_ssim = (
-        round(sum(m["ssim"] for m in quality_metrics) / len(quality_metrics), 4)
-        if quality_metrics
-        else 0.0
+    path = job_queue.result_path(job_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Job result not found")
+    return FileResponse(
+        path=str(path),
+        media_type="application/zip",
+        filename="augmented_dataset.zip",
     )
-    metrics = {
-        "total_synthetic_images": len(result.synthetics),
-        "total_original_images": len(result.originals),
-        "classes": classes,
-        "quality_metrics": quality_metrics,
-        "average_quality": {"cosine_similarity": avg_cos, "ssim": avg_ssim},
-    }
-    response_json = {
-        "count": len(result.synthetics),
-        "synthetic_images": synthetic_images_json,
-        "metrics": metrics,
-    }
-    import zipfile
-    import io
-    import json
-    from pathlib import Path
 
-    log.info("Creating ZIP file with augmented dataset")
-    zip_buffer = io.BytesIO()
-    try:
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-            zipf.writestr(
-                "augmentation_metadata.json", json.dumps(response_json, indent=2)
-            )
-            log.info("Added metadata JSON to ZIP")
-            log.info("Adding original images to ZIP")
-            for orig_info in result.originals:
-                label = orig_info.label
-                orig_path = Path(orig_info.path)
-                if orig_path.exists():
-                    with open(orig_path, "rb") as f:
-                        zipf.writestr(f"{label}/{orig_path.name}", f.read())
-                    log.debug(f"Added original: {label}/{orig_path.name}")
-            log.info("Adding synthetic images to ZIP")
-            for synth_info in result.synthetics:
-                label = synth_info.label
-                synth_path = Path(synth_info.path)
-                if synth_path.exists():
-                    with open(synth_path, "rb") as f:
-                        zipf.writestr(f"{label}/{synth_path.name}", f.read())
-                    log.debug(f"Added synthetic: {label}/{synth_path.name}")
-        zip_buffer.seek(0)
-        zip_bytes = zip_buffer.getvalue()
-        log.info(f"ZIP file created successfully, size: {len(zip_bytes)} bytes")
-        return Response(
-            content=zip_bytes,
+
+def smote_response(req: AugmentRequest, scope: str) -> StreamingResponse:
+    images_with_labels = resolve_images(req.images)
+    cache_key = result_cache.key(images_with_labels, load_params())
+    headers = {"Content-Disposition": "attachment; filename=augmented_dataset.zip"}
+    cached = result_cache.get(cache_key) if cache_key else None
+    if cached:
+        log.info(f"Serving cached SMOTE result {cache_key}")
+        handle, _ = cached
+        return StreamingResponse(
+            result_cache.stream(handle),
             media_type="application/zip",
             headers={
-                "Content-Disposition": "attachment; filename=augmented_dataset.zip",
-                "Content-Type": "application/zip",
+                **headers,
+                "Content-Length": str(os.fstat(handle.fileno()).st_size),
+                "X-Cache": "hit",
             },
         )
-    except Exception as e:
-        log.error(f"Failed to create ZIP file: {e}", exc_info=True)
-        raise HTTPException(
-            status_code=500, detail=f"Failed to create ZIP file: {str(e)}"
-        )
+    result, response_json = augment_dataset(images_with_labels, scope)
+    chunks = iter_zip(response_json, result)
+    if cache_key:
+        meta = {"count": len(result.synthetics), "report": response_json}
+        chunks = result_cache.tee(cache_key, chunks, meta)
+    return StreamingResponse(
+        chunks,
+        media_type="application/zip",
+        headers={**headers, "X-Cache": "miss"},
+    )
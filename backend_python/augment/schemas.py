@@ -1,7 +1,9 @@
 from __future__ import annotations
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import List, Literal, Optional, Tuple
 from pathlib import Path
-from pydantic import BaseModel, Field
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class ImageRef(BaseModel):
@@ -32,14 +34,84 @@ class AugmentResult(BaseModel):
 class ImageInfo(BaseModel):
     path: Path
     label: str
+    sha256: Optional[str] = None
 
 
-class SyntheticImages(BaseModel):
-    originals: List[ImageInfo]
-    synthetics: List[ImageInfo]
+@dataclass
+class FeatureSet:
+    shape: Tuple[int, int, int]
+    originals: np.ndarray
+    original_labels: List[str]
+    synthetics: np.ndarray
+    synthetic_rows: np.ndarray
+    original_shas: List[Optional[str]] = field(default_factory=list)
 
 
 class ParameterSet(BaseModel):
     kneighbors: int = Field(default=5, ge=1)
     targetratio: Optional[float] = Field(default=None, ge=0.0, le=1.0)
     randomstate: Optional[int] = Field(default=42)
+    width: int = Field(default=256, ge=8, le=4096)
+    height: int = Field(default=256, ge=8, le=4096)
+    channelmode: Literal["L", "RGB"] = "RGB"
+    neighborsearch: Literal["exact", "pca", "projection"] = "exact"
+    reduceddims: int = Field(default=64, ge=1)
+    recallsample: int = Field(default=32, ge=0)
+    neighborindex: Literal["exact", "ivf"] = "exact"
+    ivflists: int = Field(default=0, ge=0)
+    ivfprobes: int = Field(default=8, ge=1)
+    annminclass: int = Field(default=1000, ge=2)
+    incremental: bool = True
+    metricsmode: Literal["full", "downsampled", "sampled"] = "full"
+    metricssize: int = Field(default=64, ge=8)
+    metricssample: int = Field(default=500, ge=1)
+    metricsbudget: float = Field(default=0.0, ge=0.0)
+
+
+class NeighborSearchReport(BaseModel):
+    mode: str
+    dims: Optional[int] = None
+    recall: Optional[float] = None
+    sampled: int = 0
+    index: str = "exact"
+    indexed: List[str] = Field(default_factory=list)
+
+
+class SyntheticImages(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    originals: List[ImageInfo]
+    synthetics: List[ImageInfo]
+    features: Optional[FeatureSet] = Field(default=None, exclude=True)
+    neighbor_search: Optional[NeighborSearchReport] = None
+    params: Optional[ParameterSet] = Field(default=None, exclude=True)
+
+
+class SyntheticRecord(BaseModel):
+    file: str
+    base: str
+    partner: str
+    step: float
+
+
+class AugmentationState(BaseModel):
+    config: str = ""
+    members: List[str]
+    neighbors: List[List[int]] = Field(default_factory=list)
+    distances: List[List[float]] = Field(default_factory=list)
+    synthetics: List[SyntheticRecord] = Field(default_factory=list)
+    generation: int = 0
+
+
+class JobState(BaseModel):
+    id: str
+    owner: str
+    status: Literal["queued", "running", "done", "failed"] = "queued"
+    progress: float = 0.0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+    error: Optional[str] = None
+    count: Optional[int] = None
+    pid: int
+    pid_started: Optional[str] = None
@@ -5,34 +5,61 @@ import zipfile
 import io
 import json
 import os
+import tempfile
+import time
 from collections import Counter
+from contextlib import ExitStack
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 import numpy as np
 from PIL import Image
-from imblearn.over_sampling import SMOTE
-from .schemas import SyntheticImages, ParameterSet, ImageInfo, AugmentOptions
+from .schemas import (
+    AugmentationState,
+    AugmentOptions,
+    FeatureSet,
+    ImageInfo,
+    NeighborSearchReport,
+    ParameterSet,
+    SyntheticImages,
+    SyntheticRecord,
+)
+from .cache import preprocess_cache
+from .decode import decode_tag, preprocess
+from .ann import list_count, load_index
+from .reduce import dataset_key, embed, load_reducer
+from .smote import SmoteEngine
+from .state import state_store
 from assets.registry import registry
 from config import settings
 
 log = logging.getLogger(__name__)
-SIZE = (256, 256)
+preprocess_pool = ThreadPoolExecutor(
+    max_workers=max(1, settings.PREPROCESSWORKERS), thread_name_prefix="preprocess"
+)
+write_pool = ThreadPoolExecutor(
+    max_workers=max(1, settings.SYNTHETICWRITERS), thread_name_prefix="synthetic"
+)
+CODEC_SUFFIXES = {"png": ".png", "webp": ".webp", "npy": ".npy"}
 
 
-def _validate_image(im: Image.Image) -> None:
-    if im.mode not in ["RGB", "L", "RGBA", "P"]:
-        raise ValueError(
-            f"Unsupported mode; expected RGB, L, RGBA, or P, got {im.mode}"
-        )
+def vec(img: Image.Image) -> np.ndarray:
+    return np.asarray(img, dtype=np.uint8).reshape(-1)
 
 
-def vec(img: Image.Image) -> np.ndarray:
-    arr = np.asarray(img)
-    return arr.reshape(-1).astype(np.float32)
+def pixels(vec: np.ndarray, shape: tuple) -> np.ndarray:
+    arr = vec.reshape(shape)
+    if arr.dtype != np.uint8:
+        arr = np.clip(np.rint(arr), 0, 255).astype(np.uint8)
+    return arr[:, :, 0] if shape[2] == 1 else arr
 
 
 def mat(vec: np.ndarray, shape: tuple) -> Image.Image:
-    return Image.fromarray(vec.reshape(shape[0], shape[1], shape[2]).astype(np.uint8))
+    return Image.fromarray(pixels(vec, shape))
+
+
+def target_shape(params: ParameterSet) -> Tuple[int, int, int]:
+    return (params.height, params.width, 1 if params.channelmode == "L" else 3)
 
 
 def load_params() -> ParameterSet:
@@ -65,70 +92,404 @@ def _compute_strategy(y: list[str], targetratio: float | None) -> dict[str, int]
     return {cls: target for cls, cnt in eligible.items() if cnt < target}
 
 
-def run_smote(originals: list[ImageInfo]) -> SyntheticImages:
+def allocate_matrix(
+    rows: int, cols: int, budget: int, dtype: type = np.uint8
+) -> np.ndarray:
+    if rows * cols * np.dtype(dtype).itemsize <= budget:
+        return np.empty((rows, cols), dtype=dtype)
+    scratch = settings.CACHEPATH / "scratch"
+    scratch.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=str(scratch), prefix="matrix_", suffix=f".{np.dtype(dtype).name}"
+    ) as tmp:
+        log.info(f"Backing {rows}x{cols} feature matrix with a memmap")
+        return np.memmap(tmp, dtype=dtype, mode="w+", shape=(rows, cols))
+
+
+def resident_bytes(m: np.ndarray) -> int:
+    return 0 if isinstance(m, np.memmap) else m.nbytes
+
+
+def encode_synthetic(vec_row: np.ndarray, shape: tuple, path: Path) -> float:
+    start = time.perf_counter()
+    codec = settings.SYNTHETICCODEC
+    if codec == "npy":
+        np.save(path, pixels(vec_row, shape))
+    elif codec == "webp":
+        mat(vec_row, shape).save(
+            path, format="WEBP", lossless=True, quality=settings.WEBPEFFORT
+        )
+    else:
+        mat(vec_row, shape).save(
+            path, format="PNG", compress_level=settings.PNGCOMPRESSLEVEL
+        )
+    return time.perf_counter() - start
+
+
+def restore_class(
+    engine: SmoteEngine,
+    label: str,
+    shas: list[str],
+    key: str,
+    config: str,
+    exact_graph: bool,
+) -> Optional[AugmentationState]:
+    state = state_store.load(key)
+    if state is None:
+        return None
+    if state.config != config:
+        removed = state_store.discard(state.synthetics)
+        log.info(f"Dropped {removed} synthetics for {label} made with other settings")
+        return None
+    if exact_graph and len(state.neighbors) == len(state.members):
+        positions = {sha: i for i, sha in enumerate(shas)}
+        remap = np.array(
+            [positions.get(sha, -1) for sha in state.members], dtype=np.int64
+        )
+        old_nns = np.array(state.neighbors, dtype=np.int64).reshape(-1, engine.k)
+        old_dist = np.array(state.distances, dtype=np.float64).reshape(-1, engine.k)
+        mapped = remap[old_nns]
+        valid = (remap >= 0) & (mapped >= 0).all(axis=1)
+        kept = remap[valid]
+        order = np.argsort(kept)
+        added = np.setdiff1d(np.arange(len(shas)), remap[remap >= 0])
+        engine.update_neighbors(
+            label, kept[order], mapped[valid][order], old_dist[valid][order], added
+        )
+        log.info(
+            f"Updated neighbors for {label}: {len(kept)} reused, "
+            f"{len(shas) - len(kept)} recomputed"
+        )
+    return state
+
+
+def reusable_records(
+    state: AugmentationState, kept: list[ImageInfo], rows: np.ndarray
+) -> list[SyntheticRecord]:
+    members = {kept[r].sha256 for r in rows}
+    records = []
+    for rec in state.synthetics:
+        path = settings.ASSETSPATH / rec.file
+        if rec.base in members and rec.partner in members and path.exists():
+            records.append(rec)
+        else:
+            path.unlink(missing_ok=True)
+    return records
+
+
+def save_class(
+    engine: SmoteEngine,
+    label: str,
+    kept: list[ImageInfo],
+    key: str,
+    config: str,
+    previous: Optional[AugmentationState],
+    records: list[SyntheticRecord],
+    exact_graph: bool,
+) -> None:
+    rows = engine.class_rows(label)
+    used = {rec.file for rec in records}
+    if previous is not None:
+        removed = state_store.discard(
+            [rec for rec in previous.synthetics if rec.file not in used]
+        )
+        if removed:
+            log.info(f"Removed {removed} superseded synthetics for {label}")
+    state = AugmentationState(
+        config=config,
+        members=[kept[r].sha256 for r in rows],
+        synthetics=records,
+        generation=(previous.generation + 1) if previous is not None else 1,
+    )
+    if exact_graph and label in engine.distances:
+        state.neighbors = engine.graph[label].tolist()
+        state.distances = engine.distances[label].tolist()
+    try:
+        state_store.save(key, state)
+    except Exception as e:
+        log.error(f"Failed to save augmentation state for {label}: {e}")
+
+
+def load_original(
+    info: ImageInfo, size: Tuple[int, int], mode: str, X: np.ndarray, row: int
+) -> bool:
+    reducing_gap = settings.DECODEREDUCINGGAP or None
+    tag = decode_tag(mode, reducing_gap)
+    if info.sha256:
+        cached = preprocess_cache.get(info.sha256, size, tag)
+        if cached is not None:
+            X[row] = vec(cached)
+            return True
+    try:
+        with Image.open(info.path) as im:
+            im_resized = preprocess(im, size, mode, reducing_gap)
+            if im_resized is None:
+                log.warning(
+                    f"Skipping image with unsupported mode {im.mode}: {info.path}"
+                )
+                return False
+            arr = np.asarray(im_resized)
+            if info.sha256:
+                preprocess_cache.put(info.sha256, size, tag, arr)
+            X[row] = vec(arr)
+            return True
+    except Exception as e:
+        log.warning(f"Failed to load image {info.path}: {e}")
+        return False
+
+
+def discard_writes(
+    writes: list[tuple[int, ImageInfo, Optional[Future], Optional[SyntheticRecord]]],
+) -> None:
+    removed = 0
+    for _, info, future, _ in writes:
+        if future is None:
+            continue
+        if not future.cancel():
+            future.exception()
+        info.path.unlink(missing_ok=True)
+        removed += 1
+    if removed:
+        log.info(f"Discarded {removed} synthetic images from the failed run")
+
+
+def run_smote(
+    originals: list[ImageInfo],
+    scope: str,
+    progress: Optional[Callable[[float], None]] = None,
+) -> SyntheticImages:
+    report = progress or (lambda fraction: None)
     params = load_params()
-    X: list[np.ndarray] = []
+    if not originals:
+        return SyntheticImages(originals=originals, synthetics=[])
+    budget = settings.SMOTEMEMORYMB * 1024 * 1024
+    shape = target_shape(params)
+    size, mode = (params.width, params.height), params.channelmode
+    dim = shape[0] * shape[1] * shape[2]
+    X = allocate_matrix(len(originals), dim, budget // 2)
+    timings: dict[str, float] = {}
+    stage = time.perf_counter()
+    futures = [
+        preprocess_pool.submit(load_original, info, size, mode, X, row)
+        for row, info in enumerate(originals)
+    ]
+    for done, _ in enumerate(as_completed(futures)):
+        report(0.5 * done / len(originals))
     y: list[str] = []
-    target_width, target_height = SIZE
-    for info in originals:
-        try:
-            with Image.open(info.path) as im:
-                _validate_image(im)
-                if im.mode == "L":
-                    im = im.convert("RGB")
-                elif im.mode == "RGBA":
-                    background = Image.new("RGB", im.size, (255, 255, 255))
-                    background.paste(im, mask=im.split()[3])
-                    im = background
-                elif im.mode == "P":
-                    im = im.convert("RGB")
-                elif im.mode != "RGB":
-                    log.warning(
-                        f"Skipping image with unsupported mode {im.mode}: {info.path}"
-                    )
-                    continue
-                im_resized = im.resize(SIZE, Image.LANCZOS)
-                X.append(vec(im_resized))
-                y.append(info.label)
-        except Exception as e:
-            log.warning(f"Failed to load image {info.path}: {e}")
+    kept: list[ImageInfo] = []
+    for row, (info, future) in enumerate(zip(originals, futures)):
+        if not future.result():
             continue
-    if not X:
+        if row != len(y):
+            X[len(y)] = X[row]
+        y.append(info.label)
+        kept.append(info)
+    timings["preprocess"] = time.perf_counter() - stage
+    stage = time.perf_counter()
+    if not y:
         return SyntheticImages(originals=originals, synthetics=[])
+    X = X[: len(y)]
+    labels = np.array(y)
     strategy = _compute_strategy(y, params.targetratio)
     if not strategy:
         log.info("No resampling needed")
         return SyntheticImages(originals=originals, synthetics=[])
-    eligible_counts = Counter(c for c in y if c in strategy)
-    min_eligible = min(eligible_counts.values()) if eligible_counts else 0
+    counts = Counter(y)
+    eligible_counts = {c: counts[c] for c in strategy}
+    min_eligible = min(eligible_counts.values())
     keff = max(1, min(int(params.kneighbors), max(1, min_eligible - 1)))
-    try:
-        sm = SMOTE(
-            k_neighbors=keff,
-            sampling_strategy=strategy,
-            random_state=params.randomstate,
+    plan = {label: target - counts[label] for label, target in sorted(strategy.items())}
+    new_rows = sum(plan.values())
+    synthetic_matrix = allocate_matrix(
+        new_rows, dim, max(budget // 2 + budget // 4 - resident_bytes(X), 0)
+    )
+    work_bytes = max(budget // 4, 1)
+    space = None
+    search = NeighborSearchReport(mode=params.neighborsearch)
+    if params.neighborsearch != "exact":
+        block = max(1, work_bytes // (dim * 8 * 2))
+        key = dataset_key([o.sha256 for o in kept], shape)
+        reducer = load_reducer(
+            X, params.neighborsearch, params.reduceddims, params.randomstate, key, block
         )
-        X_res, y_res = sm.fit_resample(np.array(X), np.array(y))
-    except Exception as e:
-        log.error(f"SMOTE failed: {e}")
-        return SyntheticImages(originals=originals, synthetics=[])
-    synthetics: list[ImageInfo] = []
+        space = embed(X, reducer, block)
+        search.dims = space.shape[1]
+    indexes = {}
+    if params.neighborindex == "ivf":
+        search_space = X if space is None else space
+        block = max(1, work_bytes // (8 * 3 * search_space.shape[1]))
+        for label in plan:
+            rows = np.flatnonzero(labels == label)
+            if len(rows) < params.annminclass:
+                continue
+            key = dataset_key(
+                [kept[r].sha256 for r in rows],
+                (shape, params.neighborsearch, search.dims, params.randomstate),
+            )
+            indexes[label] = load_index(
+                lambda p, rows=rows: search_space[rows[p]].astype(np.float64),
+                len(rows),
+                search_space.shape[1],
+                list_count(len(rows), params.ivflists),
+                params.randomstate,
+                key,
+                "ivf",
+                block,
+            )
+        search.index = "ivf"
+        search.indexed = sorted(indexes)
+    engine = SmoteEngine(
+        X,
+        labels,
+        keff,
+        params.randomstate,
+        work_bytes,
+        space,
+        indexes,
+        params.ivfprobes,
+    )
+    timings["index"] = time.perf_counter() - stage
+    stage = time.perf_counter()
     output_dir = settings.ASSETSPATH / "synthetic"
-    for vec_row, label in zip(X_res[len(X) :], y_res[len(y) :]):
-        shape = (SIZE[1], SIZE[0], 3)
+    suffix = CODEC_SUFFIXES[settings.SYNTHETICCODEC]
+    exact_graph = space is None and not indexes
+    writes: list[tuple[int, ImageInfo, Optional[Future], Optional[SyntheticRecord]]]
+    writes = []
+    states: dict[str, tuple[str, AugmentationState]] = {}
+    config = state_store.config(params, shape, keff)
+    with ExitStack() as locks:
         try:
-            img = mat(vec_row, shape)
-            fname = f"{uuid.uuid4().hex}-{label}.png"
-            savepath = output_dir / label
-            savepath.mkdir(parents=True, exist_ok=True)
-            full_path = savepath / fname
-            img.save(full_path)
-            synthetics.append(ImageInfo(path=full_path, label=label))
+            for label in plan:
+                (output_dir / label).mkdir(parents=True, exist_ok=True)
+                shas = [kept[r].sha256 for r in engine.class_rows(label)]
+                if params.incremental and all(shas) and len(set(shas)) == len(shas):
+                    key = state_store.key(scope, label)
+                    locks.enter_context(state_store.lock(key))
+                    states[label] = (
+                        key,
+                        restore_class(engine, label, shas, key, config, exact_graph),
+                    )
+                engine.neighbors(label)
+            timings["neighbors"] = time.perf_counter() - stage
+            stage = time.perf_counter()
+            offset = 0
+            reused = 0
+            for label, n_samples in plan.items():
+                rows = engine.class_rows(label)
+                out = synthetic_matrix[offset : offset + n_samples]
+                records: list[SyntheticRecord] = []
+                state = states[label][1] if label in states else None
+                if state is not None:
+                    records = reusable_records(state, kept, rows)[:n_samples]
+                    positions = {kept[r].sha256: r for r in rows}
+                    base = np.array(
+                        [positions[rec.base] for rec in records], dtype=np.int64
+                    )
+                    partner = np.array(
+                        [positions[rec.partner] for rec in records], dtype=np.int64
+                    )
+                    steps = np.array([[rec.step] for rec in records], dtype=np.float64)
+                    for _ in engine.interpolate(
+                        base, partner, steps, out[: len(records)]
+                    ):
+                        pass
+                    for i, rec in enumerate(records):
+                        info = ImageInfo(
+                            path=settings.ASSETSPATH / rec.file, label=label
+                        )
+                        writes.append((offset + i, info, None, rec))
+                    reused += len(records)
+                seed = params.randomstate
+                if state is not None and state.generation and seed is not None:
+                    seed = np.random.RandomState([seed, state.generation])
+                base, partner, steps = engine.draw(
+                    label, n_samples - len(records), seed
+                )
+                first = offset + len(records)
+                for start, stop in engine.interpolate(
+                    base, partner, steps, out[len(records) :]
+                ):
+                    for i in range(start, stop):
+                        j = first + i
+                        path = (
+                            output_dir / label / f"{uuid.uuid4().hex}-{label}{suffix}"
+                        )
+                        future = write_pool.submit(
+                            encode_synthetic, synthetic_matrix[j], shape, path
+                        )
+                        rec = SyntheticRecord(
+                            file=str(path.relative_to(settings.ASSETSPATH)),
+                            base=kept[base[i]].sha256 or "",
+                            partner=kept[partner[i]].sha256 or "",
+                            step=float(steps[i, 0]),
+                        )
+                        writes.append(
+                            (j, ImageInfo(path=path, label=label), future, rec)
+                        )
+                    report(0.5 + 0.25 * (first + stop) / new_rows)
+                offset += n_samples
+            if reused:
+                log.info(f"Reused {reused} synthetic images from earlier runs")
+            timings["generate"] = time.perf_counter() - stage
+            stage = time.perf_counter()
+            synthetics: list[ImageInfo] = []
+            saved_rows: list[int] = []
+            saved: dict[str, list[SyntheticRecord]] = {label: [] for label in states}
+            encode_cpu = 0.0
+            for n, (j, info, future, rec) in enumerate(writes):
+                report(0.75 + 0.25 * n / new_rows)
+                try:
+                    if future is not None:
+                        encode_cpu += future.result()
+                    synthetics.append(info)
+                    saved_rows.append(j)
+                    if info.label in saved:
+                        saved[info.label].append(rec)
+                except Exception as e:
+                    log.error(f"Failed to save synthetic image: {e}")
+                    info.path.unlink(missing_ok=True)
+            timings["encode"] = time.perf_counter() - stage
+            timings["encode_cpu"] = encode_cpu
+            if (space is not None or indexes) and params.recallsample > 0:
+                hits = total = 0
+                for label in plan:
+                    h, t = engine.recall(label, params.recallsample)
+                    hits, total = hits + h, total + t
+                    search.sampled += min(
+                        params.recallsample, len(engine.class_rows(label))
+                    )
+                search.recall = round(hits / total, 4) if total else None
+                log.info(f"Neighbor recall for {search.mode} search: {search.recall}")
+            for label, (key, state) in states.items():
+                save_class(
+                    engine, label, kept, key, config, state, saved[label], exact_graph
+                )
         except Exception as e:
-            log.error(f"Failed to save synthetic image: {e}")
-            continue
+            log.error(f"SMOTE failed: {e}")
+            discard_writes(writes)
+            return SyntheticImages(originals=originals, synthetics=[])
+    state_store.cleanup()
+    report(1.0)
     log.info(f"Generated {len(synthetics)} synthetic images")
-    return SyntheticImages(originals=originals, synthetics=synthetics)
+    log.info(
+        "SMOTE stage timings: "
+        + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in timings.items())
+    )
+    features = FeatureSet(
+        shape=shape,
+        originals=X,
+        original_labels=y,
+        original_shas=[o.sha256 for o in kept],
+        synthetics=synthetic_matrix,
+        synthetic_rows=np.array(saved_rows, dtype=np.int64),
+    )
+    return SyntheticImages(
+        originals=originals,
+        synthetics=synthetics,
+        features=features,
+        neighbor_search=search,
+        params=params,
+    )
 
 
 def augment_images(
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Tuple
+import numpy as np
+from sklearn.utils import check_random_state
+
+if TYPE_CHECKING:
+    from .ann import IVFIndex
+
+log = logging.getLogger(__name__)
+
+
+def sq_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    d = -2 * (a @ b.T)
+    d += np.einsum("ij,ij->i", a, a)[:, None]
+    d += np.einsum("ij,ij->i", b, b)[None, :]
+    return np.maximum(d, 0, out=d)
+
+
+class SmoteEngine:
+    def __init__(
+        self,
+        X: np.ndarray,
+        labels: np.ndarray,
+        k: int,
+        randomstate: Optional[int],
+        work_bytes: int,
+        space: Optional[np.ndarray] = None,
+        indexes: Optional[Dict[str, IVFIndex]] = None,
+        nprobe: int = 1,
+    ) -> None:
+        self.X = X
+        self.labels = labels
+        self.k = k
+        self.randomstate = randomstate
+        self.work_bytes = work_bytes
+        self.space = X if space is None else space
+        self.indexes = indexes or {}
+        self.nprobe = nprobe
+        self.chunk = max(1, work_bytes // (X.shape[1] * (4 + 4 + 8)))
+        self.rows: Dict[str, np.ndarray] = {}
+        self.graph: Dict[str, np.ndarray] = {}
+        self.distances: Dict[str, np.ndarray] = {}
+
+    def class_rows(self, label: str) -> np.ndarray:
+        if label not in self.rows:
+            self.rows[label] = np.flatnonzero(self.labels == label)
+        return self.rows[label]
+
+    def neighbors(self, label: str) -> np.ndarray:
+        if label not in self.graph:
+            rows = self.class_rows(label)
+            if label in self.indexes:
+                self.graph[label] = self.ann(rows, self.indexes[label])
+            else:
+                self.graph[label], self.distances[label] = self.knn(
+                    rows, self.space, return_distance=True
+                )
+        return self.graph[label]
+
+    def update_neighbors(
+        self,
+        label: str,
+        kept: np.ndarray,
+        nns: np.ndarray,
+        distances: np.ndarray,
+        added: np.ndarray,
+    ) -> None:
+        rows = self.class_rows(label)
+        k, n = self.k, len(rows)
+        graph = np.empty((n, k), dtype=np.int64)
+        dist = np.empty((n, k), dtype=np.float64)
+        stale = np.setdiff1d(np.arange(n), kept)
+        if len(stale):
+            graph[stale], dist[stale] = self.knn(
+                rows, self.space, stale, return_distance=True
+            )
+        fetch = self.fetch(rows)
+        block = max(1, self.work_bytes // (8 * 3 * self.space.shape[1]))
+        for start in range(0, len(kept), block):
+            positions = kept[start : start + block]
+            best_idx = nns[start : start + block]
+            best_dist = distances[start : start + block]
+            q = fetch(positions) if len(added) else None
+            for added_start in range(0, len(added), block):
+                candidates = added[added_start : added_start + block]
+                d = sq_distances(q, fetch(candidates))
+                cand_idx = np.hstack([best_idx, np.broadcast_to(candidates, d.shape)])
+                cand_dist = np.hstack([best_dist, d])
+                order = np.argsort(cand_dist, axis=1, kind="stable")[:, :k]
+                best_idx = np.take_along_axis(cand_idx, order, axis=1)
+                best_dist = np.take_along_axis(cand_dist, order, axis=1)
+            graph[positions] = best_idx
+            dist[positions] = best_dist
+        self.graph[label] = graph
+        self.distances[label] = dist
+
+    def fetch(self, rows: np.ndarray) -> Callable[[np.ndarray], np.ndarray]:
+        return lambda positions: self.space[rows[positions]].astype(np.float64)
+
+    def ann(self, rows: np.ndarray, index: IVFIndex) -> np.ndarray:
+        fetch = self.fetch(rows)
+        block = max(1, self.work_bytes // (8 * (2 * self.space.shape[1] + len(rows))))
+        nns = np.empty((len(rows), self.k), dtype=np.int64)
+        for start in range(0, len(rows), block):
+            positions = np.arange(start, min(start + block, len(rows)))
+            nns[positions] = index.search(
+                fetch, fetch(positions), self.k, self.nprobe, exclude=positions
+            )
+        return nns
+
+    def recall(self, label: str, sample: int) -> Tuple[int, int]:
+        nns = self.neighbors(label)
+        if (self.space is self.X and not self.indexes) or sample <= 0:
+            return nns.size, nns.size
+        rows = self.class_rows(label)
+        rng = np.random.RandomState(0)
+        queries = np.sort(rng.choice(len(rows), min(sample, len(rows)), replace=False))
+        exact = self.knn(rows, self.X, queries)
+        hits = sum(
+            len(np.intersect1d(found, truth))
+            for found, truth in zip(nns[queries], exact)
+        )
+        return hits, exact.size
+
+    def knn(
+        self,
+        rows: np.ndarray,
+        space: np.ndarray,
+        queries: Optional[np.ndarray] = None,
+        return_distance: bool = False,
+    ):
+        n, k = len(rows), self.k
+        queries = np.arange(n) if queries is None else queries
+        block = max(1, self.work_bytes // (8 * (2 * space.shape[1] + n)))
+        blocks = [(start, rows[start : start + block]) for start in range(0, n, block)]
+        sq = np.empty(n, dtype=np.float64)
+        for start, idx in blocks:
+            b = space[idx].astype(np.float64)
+            sq[start : start + len(idx)] = np.einsum("ij,ij->i", b, b)
+        nns = np.empty((len(queries), k + 1), dtype=np.int64)
+        nn_dist = np.empty((len(queries), k + 1), dtype=np.float64)
+        dist = np.empty((min(block, len(queries)), n), dtype=np.float64)
+        for qs in range(0, len(queries), block):
+            qpos = queries[qs : qs + block]
+            q = space[rows[qpos]].astype(np.float64)
+            d = dist[: len(qpos)]
+            for rs, ridx in blocks:
+                r = space[ridx].astype(np.float64)
+                np.matmul(q, r.T, out=d[:, rs : rs + len(ridx)])
+            d *= -2
+            d += sq[qpos, None]
+            d += sq[None, :]
+            np.maximum(d, 0, out=d)
+            d[np.arange(len(qpos)), qpos] = 0
+            part = np.argpartition(d, k, axis=1)[:, : k + 1]
+            part_dist = np.take_along_axis(d, part, axis=1)
+            order = np.argsort(part_dist, axis=1)
+            nns[qs : qs + len(qpos)] = np.take_along_axis(part, order, axis=1)
+            nn_dist[qs : qs + len(qpos)] = np.take_along_axis(part_dist, order, axis=1)
+        if return_distance:
+            return nns[:, 1:], nn_dist[:, 1:]
+        return nns[:, 1:]
+
+    def sample(
+        self, label: str, n_samples: int, out: np.ndarray
+    ) -> Iterator[Tuple[int, int]]:
+        base, partner, steps = self.draw(label, n_samples)
+        return self.interpolate(base, partner, steps, out)
+
+    def draw(
+        self, label: str, n_samples: int, randomstate=None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = self.class_rows(label)
+        nns = self.neighbors(label)
+        rng = check_random_state(
+            self.randomstate if randomstate is None else randomstate
+        )
+        picks = rng.randint(low=0, high=nns.size, size=n_samples)
+        steps = rng.uniform(size=n_samples)[:, np.newaxis]
+        base = rows[np.floor_divide(picks, nns.shape[1])]
+        partner = rows[
+            nns[np.floor_divide(picks, nns.shape[1]), np.mod(picks, nns.shape[1])]
+        ]
+        return base, partner, steps
+
+    def interpolate(
+        self,
+        base: np.ndarray,
+        partner: np.ndarray,
+        steps: np.ndarray,
+        out: np.ndarray,
+    ) -> Iterator[Tuple[int, int]]:
+        n_samples = len(base)
+        if n_samples == 0:
+            return
+        chunk = min(self.chunk, n_samples)
+        dim = self.X.shape[1]
+        x = np.empty((chunk, dim), dtype=np.float32)
+        diff = np.empty((chunk, dim), dtype=np.float32)
+        work = np.empty((chunk, dim), dtype=np.float64)
+        bounds = np.iinfo(out.dtype) if np.issubdtype(out.dtype, np.integer) else None
+        for start in range(0, n_samples, chunk):
+            stop = min(start + chunk, n_samples)
+            m = stop - start
+            x[:m] = self.X[base[start:stop]]
+            diff[:m] = self.X[partner[start:stop]]
+            np.subtract(diff[:m], x[:m], out=diff[:m])
+            np.multiply(steps[start:stop], diff[:m], out=work[:m])
+            np.add(work[:m], x[:m], out=work[:m])
+            if bounds is not None:
+                np.rint(work[:m], out=work[:m])
+                np.clip(work[:m], bounds.min, bounds.max, out=work[:m])
+            out[start:stop] = work[:m]
+            yield start, stop
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+from filelock import FileLock, Timeout
+from .decode import decode_tag
+from .schemas import AugmentationState, ParameterSet, SyntheticRecord
+from config import settings
+
+log = logging.getLogger(__name__)
+CLEANUP_INTERVAL = 3600
+
+
+class StateStore:
+    def __init__(self, root: Path, retention: int) -> None:
+        self.root = root
+        self.retention = retention
+        self.cleaned = 0.0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def key(self, scope: str, label: str) -> str:
+        encoded = json.dumps([scope, label]).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def config(self, params: ParameterSet, shape: tuple, k: int) -> str:
+        config = [
+            shape,
+            k,
+            params.randomstate,
+            params.neighborsearch,
+            params.reduceddims,
+            params.neighborindex,
+            settings.SYNTHETICCODEC,
+            decode_tag(params.channelmode, settings.DECODEREDUCINGGAP),
+        ]
+        return hashlib.sha256(json.dumps(config).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def lock(self, key: str) -> FileLock:
+        return FileLock(str(self.root / f"{key}.lock"))
+
+    def load(self, key: str) -> Optional[AugmentationState]:
+        path = self.path(key)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return AugmentationState(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            log.error(f"Failed to read augmentation state {key}: {e}")
+            return None
+
+    def save(self, key: str, state: AugmentationState) -> None:
+        with tempfile.NamedTemporaryFile(
+            "w", delete=False, dir=str(self.root), encoding="utf-8", prefix=".tmp_"
+        ) as tmp:
+            json.dump(state.model_dump(), tmp)
+            tmp_name = tmp.name
+        os.replace(tmp_name, self.path(key))
+
+    def discard(self, records: List[SyntheticRecord]) -> int:
+        for rec in records:
+            (settings.ASSETSPATH / rec.file).unlink(missing_ok=True)
+        return len(records)
+
+    def cleanup(self) -> None:
+        now = time.time()
+        if now - self.cleaned < CLEANUP_INTERVAL:
+            return
+        self.cleaned = now
+        keys = {p.stem for p in self.root.glob("*.json")}
+        keys |= {p.stem for p in self.root.glob("*.lock")}
+        removed = 0
+        for key in keys:
+            path = self.path(key)
+            marker = path if path.exists() else self.root / f"{key}.lock"
+            try:
+                if now - marker.stat().st_mtime < self.retention:
+                    continue
+            except OSError:
+                continue
+            lock = self.lock(key)
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+            try:
+                state = self.load(key)
+                if state is not None:
+                    self.discard(state.synthetics)
+                path.unlink(missing_ok=True)
+                Path(lock.lock_file).unlink(missing_ok=True)
+                removed += 1
+            except OSError as e:
+                log.warning(f"Failed to remove augmentation state {key}: {e}")
+            finally:
+                lock.release()
+        if removed:
+            log.info(f"Removed {removed} expired augmentation states")
+
+
+state_store = StateStore(settings.STATEPATH, settings.STATERETENTIONSECONDS)
+state_store.cleanup()
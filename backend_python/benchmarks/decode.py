@@ -0,0 +1,82 @@
+from __future__ import annotations
+import argparse
+import importlib.util
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from PIL import Image
+
+spec = importlib.util.spec_from_file_location(
+    "decode", Path(__file__).resolve().parents[1] / "augment" / "decode.py"
+)
+decode = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(decode)
+
+
+def make_image(path: Path, megapixels: float, fmt: str) -> None:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rs = np.random.RandomState(0)
+    small = rs.randint(0, 256, size=(height // 16 + 1, width // 16 + 1, 3))
+    arr = np.kron(small, np.ones((16, 16, 1)))[:height, :width].astype(np.uint8)
+    arr = np.clip(arr + rs.randint(-8, 8, size=arr.shape), 0, 255).astype(np.uint8)
+    Image.fromarray(arr).save(
+        path, format=fmt, **({"quality": 90} if fmt == "JPEG" else {})
+    )
+
+
+def measure(path: str, size, mode: str, reducing_gap, repeat: int):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with Image.open(path) as im:
+            out = decode.preprocess(im, size, mode, reducing_gap)
+            np.asarray(out)
+        timings.append(time.perf_counter() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return min(timings), (peak - base) / 1024
+
+
+def run(path: Path, size, mode: str, reducing_gap, repeat: int):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(
+            measure, str(path), size, mode, reducing_gap, repeat
+        ).result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Decode + resize cost per megapixel with and without reduced decoding"
+    )
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12, 24])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"])
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--mode", default="RGB", choices=["RGB", "L"])
+    parser.add_argument("--reducing-gap", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = (args.size, args.size)
+    print(
+        f"{'format':>6} {'MP':>5} {'path':>8} {'ms':>9} {'ms/MP':>7} "
+        f"{'peak MB':>8} {'MB/MP':>6}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            for mp in args.megapixels:
+                path = Path(tmp) / f"bench_{mp}.{fmt.lower()}"
+                make_image(path, mp, fmt)
+                for name, gap in (("full", None), ("reduced", args.reducing_gap)):
+                    elapsed, peak = run(path, size, args.mode, gap, args.repeat)
+                    print(
+                        f"{fmt:>6} {mp:>5g} {name:>8} {elapsed * 1000:>9.1f} "
+                        f"{elapsed * 1000 / mp:>7.1f} {peak:>8.1f} {peak / mp:>6.2f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import argparse
+import importlib.util
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+from imblearn.over_sampling import SMOTE
+
+spec = importlib.util.spec_from_file_location(
+    "smote_engine", Path(__file__).resolve().parents[1] / "augment" / "smote.py"
+)
+smote = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(smote)
+
+
+def make_dataset(counts, dim, seed):
+    rs = np.random.RandomState(seed)
+    labels = np.concatenate([[f"class{i}"] * n for i, n in enumerate(counts)])
+    X = rs.randint(0, 256, size=(len(labels), dim)).astype(np.float32)
+    return X, labels
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def run_imblearn(X, labels, strategy, k, seed):
+    sm = SMOTE(k_neighbors=k, sampling_strategy=strategy, random_state=seed)
+    X_res, _ = sm.fit_resample(X, labels)
+    return X_res[len(X) :]
+
+
+def run_engine(X, labels, strategy, k, seed, work_mb):
+    counts = {label: int((labels == label).sum()) for label in strategy}
+    plan = {label: strategy[label] - counts[label] for label in sorted(strategy)}
+    out = np.empty((sum(plan.values()), X.shape[1]), dtype=X.dtype)
+    engine = smote.SmoteEngine(X, labels, k, seed, work_mb * 1024 * 1024)
+    offset = 0
+    for label, n_samples in plan.items():
+        for _ in engine.sample(label, n_samples, out[offset : offset + n_samples]):
+            pass
+        offset += n_samples
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the in-house SMOTE engine with imblearn fit_resample"
+    )
+    parser.add_argument("--counts", type=int, nargs="+", default=[400, 120, 60])
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--kneighbors", type=int, default=5)
+    parser.add_argument("--randomstate", type=int, default=42)
+    parser.add_argument("--work-mb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dtype", choices=["uint8", "float32"], default="uint8")
+    args = parser.parse_args()
+
+    dim = args.size * args.size * 3
+    X, labels = make_dataset(args.counts, dim, args.randomstate)
+    target = max(args.counts)
+    strategy = {
+        f"class{i}": target for i, n in enumerate(args.counts) if 2 <= n < target
+    }
+    print(
+        f"{len(X)} originals, {dim} features, "
+        f"{sum(target - n for n in args.counts if 2 <= n < target)} synthetics"
+    )
+    results = {}
+    for name, fn in (
+        (
+            "imblearn",
+            lambda: run_imblearn(
+                X, labels, strategy, args.kneighbors, args.randomstate
+            ),
+        ),
+        (
+            "engine",
+            lambda: run_engine(
+                X.astype(args.dtype),
+                labels,
+                strategy,
+                args.kneighbors,
+                args.randomstate,
+                args.work_mb,
+            ),
+        ),
+    ):
+        timings = []
+        for _ in range(args.repeat):
+            out, elapsed, peak = measure(fn)
+            timings.append(elapsed)
+        results[name] = out
+        print(
+            f"{name:>9}: best {min(timings):.3f}s, "
+            f"median {float(np.median(timings)):.3f}s, peak {peak / 2**20:.1f} MB"
+        )
+    expected = results["imblearn"]
+    if args.dtype == "uint8":
+        expected = np.clip(np.rint(expected), 0, 255).astype(np.uint8)
+    mismatched = int((expected != results["engine"]).sum())
+    print(f"mismatched values: {mismatched} of {expected.size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import argparse
+import importlib.util
+import time
+from pathlib import Path
+import numpy as np
+from skimage.metrics import structural_similarity
+
+spec = importlib.util.spec_from_file_location(
+    "batched_ssim", Path(__file__).resolve().parents[1] / "metrics" / "ssim.py"
+)
+ssim = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ssim)
+
+
+def make_dataset(originals, synthetics, size, channels, seed):
+    rs = np.random.RandomState(seed)
+    shape = (size, size, channels) if channels > 1 else (size, size)
+    O = rs.randint(0, 256, size=(originals,) + shape).astype(np.uint8)
+    matches = rs.randint(0, originals, synthetics)
+    noise = rs.randint(-40, 40, size=(synthetics,) + shape)
+    S = np.clip(O[matches].astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return O, S, matches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare per-pair skimage SSIM with the batched implementation"
+    )
+    parser.add_argument("--originals", type=int, default=20)
+    parser.add_argument("--synthetics", type=int, default=200)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--channels", type=int, default=3, choices=[1, 3])
+    parser.add_argument("--randomstate", type=int, default=42)
+    args = parser.parse_args()
+
+    O, S, matches = make_dataset(
+        args.originals, args.synthetics, args.size, args.channels, args.randomstate
+    )
+    channel_axis = 2 if args.channels > 1 else None
+    start = time.perf_counter()
+    expected = np.array(
+        [
+            structural_similarity(s, O[j], channel_axis=channel_axis)
+            for s, j in zip(S, matches)
+        ]
+    )
+    reference = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = ssim.batched_ssim(S, lambda js: O[js], matches)
+    elapsed = time.perf_counter() - start
+    print(f"skimage: {reference:.3f}s, batched: {elapsed:.3f}s")
+    print(f"max abs difference: {np.abs(expected - batched).max():.3e}")
+
+
+if __name__ == "__main__":
+    main()
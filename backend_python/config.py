@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Set
+from typing import List, Literal, Set
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, field_validator
 
@@ -27,6 +27,32 @@ class Settings(BaseSettings):
     UPLOADMAXFILES: int = 200
     UPLOADMAXUNZIPPEDMB: int = 500
     UPLOADMAXFILEMB: int = 50
+    UPLOADWORKERS: int = 4
+    UPLOADEXECUTOR: str = "thread"
+    EXECUTORQUEUEDEPTH: int = 8
+    EXECUTORRETRYAFTER: int = 5
+    SMOTECONCURRENCY: int = 2
+    UPLOADCONCURRENCY: int = 2
+    METRICSCONCURRENCY: int = 4
+    JOBSDIRNAME: str = "jobs"
+    JOBWORKERS: int = 1
+    JOBMAXQUEUED: int = 32
+    JOBRETENTIONSECONDS: int = 86400
+    JOBMAXKEPT: int = 200
+    CACHEDIRNAME: str = "cache"
+    STATEDIRNAME: str = "augment_state"
+    STATERETENTIONSECONDS: int = 2592000
+    PREPROCESSCACHEMB: int = 2048
+    DECODEREDUCINGGAP: float = 2.0
+    PREPROCESSWORKERS: int = 4
+    SYNTHETICWRITERS: int = 4
+    SYNTHETICCODEC: Literal["png", "webp", "npy"] = "png"
+    PNGCOMPRESSLEVEL: int = Field(default=1, ge=0, le=9)
+    WEBPEFFORT: int = Field(default=20, ge=0, le=100)
+    SMOTEMEMORYMB: int = 2048
+    REDUCERCACHEMB: int = 512
+    INDEXCACHEMB: int = 256
+    RESULTCACHEMB: int = 1024
     ALLOWEDIMAGEEXTS: Set[str] = Field(
         default_factory=lambda: {".jpg", ".jpeg", ".png", ".webp"}
     )
@@ -35,8 +61,11 @@ class Settings(BaseSettings):
     MAXIMUM_IMAGE_PIXELS: int = 50000000
 
     ASSETSDIRNAME: str = "assets"
+    BLOBSDIRNAME: str = "blobs"
     REGISTRYDIRNAME: str = "registry"
     REGISTRYFILENAME: str = "assetsindex.json"
+    REGISTRYBACKEND: str = "sqlite"
+    REGISTRYDBFILENAME: str = "assets.db"
     PARAMSFILENAME: str = "settings.json"
     LOGLEVEL: str = "INFO"
     SECRET_KEY: str = Field(default="CHANGE_THIS_IN_PRODUCTION_USE_ENV_VAR")
@@ -62,6 +91,30 @@ class Settings(BaseSettings):
         p.mkdir(parents=True, exist_ok=True)
         return p
 
+    @property
+    def BLOBSPATH(self) -> Path:
+        p = self.DATAPATH / self.BLOBSDIRNAME
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    @property
+    def JOBSPATH(self) -> Path:
+        p = self.DATAPATH / self.JOBSDIRNAME
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    @property
+    def STATEPATH(self) -> Path:
+        p = self.DATAPATH / self.STATEDIRNAME
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
+    @property
+    def CACHEPATH(self) -> Path:
+        p = self.DATAPATH / self.CACHEDIRNAME
+        p.mkdir(parents=True, exist_ok=True)
+        return p
+
     @property
     def REGISTRYPATH(self) -> Path:
         p = self.DATAPATH / self.REGISTRYDIRNAME
@@ -72,6 +125,10 @@ class Settings(BaseSettings):
     def REGISTRYFILE(self) -> Path:
         return self.REGISTRYPATH / self.REGISTRYFILENAME
 
+    @property
+    def REGISTRYDBFILE(self) -> Path:
+        return self.REGISTRYPATH / self.REGISTRYDBFILENAME
+
     @property
     def PARAMSFILE(self) -> Path:
         return self.DATAPATH / self.PARAMSFILENAME
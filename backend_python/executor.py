@@ -0,0 +1,70 @@
+from __future__ import annotations
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+from fastapi import HTTPException
+from config import settings
+
+log = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    def __init__(self, queue_depth: int, limits: Dict[str, int]) -> None:
+        self.limits = {endpoint: max(1, n) for endpoint, n in limits.items()}
+        self.max_workers = max(1, sum(self.limits.values()))
+        self.queue_depth = max(0, queue_depth)
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="cpu"
+        )
+        self.admitted: Dict[str, int] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def limit(self, endpoint: str) -> int:
+        return self.limits.get(endpoint, 1)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            endpoint: {
+                "admitted": self.admitted.get(endpoint, 0),
+                "limit": self.limit(endpoint),
+                "queue_depth": self.queue_depth,
+            }
+            for endpoint in self.limits
+        }
+
+    async def run(
+        self, endpoint: str, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        limit = self.limit(endpoint)
+        admitted = self.admitted.get(endpoint, 0)
+        if admitted >= limit + self.queue_depth:
+            log.warning(f"Rejecting {endpoint} request: {admitted} already admitted")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy processing {endpoint} requests, retry later",
+                headers={"Retry-After": str(settings.EXECUTORRETRYAFTER)},
+            )
+        if endpoint not in self.semaphores:
+            self.semaphores[endpoint] = asyncio.Semaphore(limit)
+        self.admitted[endpoint] = admitted + 1
+        try:
+            async with self.semaphores[endpoint]:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self.pool, functools.partial(fn, *args, **kwargs)
+                )
+        finally:
+            self.admitted[endpoint] -= 1
+
+
+cpu_executor = BoundedExecutor(
+    queue_depth=settings.EXECUTORQUEUEDEPTH,
+    limits={
+        "smote": settings.SMOTECONCURRENCY,
+        "upload": settings.UPLOADCONCURRENCY,
+        "metrics": settings.METRICSCONCURRENCY,
+    },
+)
@@ -75,10 +75,11 @@ def health(request: Request) -> dict:
 @limiter.limit("100/minute")
 def ready(request: Request) -> JSONResponse:
     from assets.registry import registry
+    from executor import cpu_executor
 
     try:
         _ = registry.list_assets()
-        return JSONResponse({"status": "ready"})
+        return JSONResponse({"status": "ready", "executor": cpu_executor.stats()})
     except Exception as e:
         log.exception("Readiness check failed: %s", e)
         return JSONResponse({"status": "not_ready", "error": str(e)}, status_code=503)
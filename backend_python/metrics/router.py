@@ -7,6 +7,7 @@ from metrics.schemas import MetricsResult, ImageMetrics
 from metrics.service import compute_basic_metrics
 from config import settings
 from auth import verify_api_key
+from executor import cpu_executor
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
 api_key_header = APIKeyHeader(name=settings.API_KEY_HEADER, auto_error=False)
@@ -17,8 +18,10 @@ class MetricsRequest(BaseModel):
 
 
 @router.post("/basic", response_model=MetricsResult)
-def post_basic_metrics(
+async def post_basic_metrics(
     req: MetricsRequest, key: Annotated[str, Security(verify_api_key)]
 ) -> MetricsResult:
-    items, summary = compute_basic_metrics(req.asset_ids)
+    items, summary = await cpu_executor.run(
+        "metrics", compute_basic_metrics, req.asset_ids
+    )
     return MetricsResult(count=len(items), items=items, summary=summary)
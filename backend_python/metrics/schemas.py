@@ -27,3 +27,6 @@ class Metric(BaseModel):
 
 class MetricsReport(BaseModel):
     metrics: List[Metric]
+    mode: str = "full"
+    total: int = 0
+    truncated: bool = False
@@ -1,15 +1,21 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import logging
+import time
 import numpy as np
 from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
-from skimage.metrics import structural_similarity as ssim
+from augment.ann import IVFIndex, list_count, load_index
+from augment.reduce import dataset_key
+from augment.schemas import FeatureSet, ParameterSet
+from .ssim import batched_ssim
 from .schemas import ImageInfo, SyntheticImages, MetricsReport, Metric, ImageMetrics
 from assets.registry import registry
+from config import settings
 
 log = logging.getLogger(__name__)
+COSINE_CHUNK_BYTES = 64 * 1024 * 1024
+METRICS_BATCH = 256
 
 
 def _vec(img: Image.Image) -> np.ndarray:
@@ -17,48 +23,332 @@ def _vec(img: Image.Image) -> np.ndarray:
     return arr.reshape(-1).astype(np.float32)
 
 
-def compute_quality_metrics(data: SyntheticImages) -> MetricsReport:
-    by_label: dict[str, list[tuple[ImageInfo, np.ndarray, np.ndarray]]] = {}
-    for o in data.originals:
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+class NormalizedRows:
+    def __init__(self, source: np.ndarray, rows: np.ndarray, block: int) -> None:
+        self.source = source
+        self.rows = rows
+        self.block = block
+        self.shape = (len(rows), source.shape[1])
+        self.norms = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), block):
+            chunk = source[rows[start : start + block]].astype(np.float32)
+            self.norms[start : start + len(chunk)] = np.linalg.norm(chunk, axis=1)
+        self.norms[self.norms == 0] = 1.0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, positions) -> np.ndarray:
+        chunk = self.source[self.rows[positions]].astype(np.float32)
+        chunk /= self.norms[positions][:, None]
+        return chunk
+
+
+def nearest_originals(
+    synthetics: np.ndarray, originals: np.ndarray | NormalizedRows, block: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    block = max(1, min(block, len(originals)))
+    rows = max(1, COSINE_CHUNK_BYTES // (4 * (synthetics.shape[1] + block)))
+    best_idx = np.zeros(len(synthetics), dtype=np.int64)
+    best_cos = np.full(len(synthetics), -np.inf, dtype=np.float32)
+    for start in range(0, len(synthetics), rows):
+        chunk = _normalize_rows(synthetics[start : start + rows].astype(np.float32))
+        out = slice(start, start + len(chunk))
+        for o_start in range(0, len(originals), block):
+            sims = chunk @ originals[o_start : o_start + block].T
+            idx = np.argmax(sims, axis=1)
+            cos = sims[np.arange(len(chunk)), idx]
+            better = cos > best_cos[out]
+            best_idx[out][better] = o_start + idx[better]
+            best_cos[out][better] = cos[better]
+    return best_idx, best_cos
+
+
+def indexed_originals(
+    synthetics: np.ndarray,
+    originals: np.ndarray | NormalizedRows,
+    index: IVFIndex,
+    nprobe: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    rows = max(1, COSINE_CHUNK_BYTES // (8 * synthetics.shape[1]))
+
+    def fetch(positions: np.ndarray) -> np.ndarray:
+        return originals[positions].astype(np.float64)
+
+    best_idx = np.empty(len(synthetics), dtype=np.int64)
+    best_cos = np.empty(len(synthetics), dtype=np.float32)
+    for start in range(0, len(synthetics), rows):
+        chunk = _normalize_rows(synthetics[start : start + rows].astype(np.float32))
+        idx = index.search(fetch, chunk.astype(np.float64), 1, nprobe)[:, 0]
+        best_idx[start : start + len(chunk)] = idx
+        best_cos[start : start + len(chunk)] = np.einsum(
+            "ij,ij->i", chunk, originals[idx]
+        )
+    return best_idx, best_cos
+
+
+def _label_index(
+    data: SyntheticImages,
+    features: FeatureSet,
+    o_rows: np.ndarray,
+    o_matrix: NormalizedRows,
+    shape: tuple,
+) -> Optional[IVFIndex]:
+    params = data.params
+    if params is None or params.neighborindex != "ivf":
+        return None
+    if len(o_rows) < params.annminclass:
+        return None
+    shas = [features.original_shas[r] for r in o_rows] if features.original_shas else []
+    return load_index(
+        lambda positions: o_matrix[positions].astype(np.float64),
+        len(o_matrix),
+        o_matrix.shape[1],
+        list_count(len(o_matrix), params.ivflists),
+        params.randomstate,
+        dataset_key(shas, (shape, "cosine", params.randomstate)),
+        "ivf",
+        o_matrix.block,
+    )
+
+
+def _metrics_size(shape: tuple, params: ParameterSet) -> Optional[Tuple[int, int]]:
+    if params.metricsmode != "downsampled":
+        return None
+    height, width = shape[:2]
+    scale = params.metricssize / max(height, width)
+    if scale >= 1:
+        return None
+    return (
+        min(width, max(8, round(width * scale))),
+        min(height, max(8, round(height * scale))),
+    )
+
+
+def _downsample(pixels: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    return np.stack(
+        [np.asarray(Image.fromarray(p).resize(size, Image.BOX)) for p in pixels]
+    )
+
+
+def _load_pixels(path: Path, params: ParameterSet) -> np.ndarray:
+    with Image.open(path) as img:
+        size = _metrics_size((img.height, img.width), params)
+        if size is not None:
+            return np.asarray(img.resize(size, Image.BOX))
+        return np.asarray(img)
+
+
+def _metric_order(total: int, params: ParameterSet) -> np.ndarray:
+    if params.metricsmode != "sampled" and not params.metricsbudget:
+        return np.arange(total)
+    order = np.random.RandomState(params.randomstate).permutation(total)
+    if params.metricsmode == "sampled":
+        order = order[: params.metricssample]
+    return order
+
+
+def _index_originals(
+    originals: List[ImageInfo], params: ParameterSet
+) -> Dict[Tuple[str, tuple], Tuple[np.ndarray, List[np.ndarray]]]:
+    grouped: Dict[Tuple[str, tuple], List[np.ndarray]] = {}
+    for o in originals:
         try:
-            with Image.open(o.path) as oi:
-                o_arr = np.asarray(oi)
-                by_label.setdefault(o.label, []).append((o, _vec(oi), o_arr))
+            o_arr = _load_pixels(o.path, params)
+            grouped.setdefault((o.label, o_arr.shape), []).append(o_arr)
         except Exception as e:
             log.warning(f"Failed to load original image {o.path}: {e}")
             continue
-    results: list[Metric] = []
-    for s in data.synthetics:
-        originals = by_label.get(s.label, [])
-        if not originals:
-            log.debug(f"No originals found for label {s.label}")
-            continue
-        try:
-            with Image.open(s.path) as si:
-                s_arr = np.asarray(si)
-                s_vec = _vec(si)
-        except Exception as e:
-            log.warning(f"Failed to load synthetic image {s.path}: {e}")
-            continue
-        best_cos = -1.0
-        best_o_arr = None
-        for _, o_vec, o_arr in originals:
-            try:
-                cos = float(cosine_similarity(s_vec[None, :], o_vec[None, :])[0, 0])
-                if cos > best_cos:
-                    best_cos = cos
-                    best_o_arr = o_arr
-            except Exception as e:
-                log.warning(f"Failed to compute similarity: {e}")
+    return {
+        key: (_normalize_rows(np.stack([_vec(a) for a in arrs])), arrs)
+        for key, arrs in grouped.items()
+    }
+
+
+def _ssim_scores(
+    synthetics: np.ndarray, fetch: Callable[[np.ndarray], np.ndarray], matches
+) -> np.ndarray:
+    try:
+        return batched_ssim(synthetics, fetch, np.asarray(matches))
+    except Exception as e:
+        log.warning(f"Failed to compute SSIM: {e}")
+        return np.zeros(len(synthetics))
+
+
+def _budget_spent(deadline: Optional[float], done: int, total: int) -> bool:
+    if deadline is None or done == 0 or time.monotonic() < deadline:
+        return False
+    log.info(f"Metrics time budget spent after {done} of {total} synthetics")
+    return True
+
+
+def compute_quality_metrics(
+    data: SyntheticImages, progress: Optional[Callable[[float], None]] = None
+) -> MetricsReport:
+    report = progress or (lambda fraction: None)
+    params = data.params or ParameterSet()
+    if data.features is not None:
+        return _metrics_from_features(data, data.features, params, report)
+    deadline = time.monotonic() + params.metricsbudget if params.metricsbudget else None
+    index = _index_originals(data.originals, params)
+    labels = {label for label, _ in index}
+    order = _metric_order(len(data.synthetics), params)
+    metrics: List[Optional[Metric]] = [None] * len(data.synthetics)
+    truncated = len(order) < len(data.synthetics)
+    for start in range(0, len(order), METRICS_BATCH):
+        if _budget_spent(deadline, start, len(order)):
+            truncated = True
+            break
+        report(start / len(order))
+        groups: Dict[Tuple[str, tuple], List[Tuple[int, np.ndarray]]] = {}
+        for i in order[start : start + METRICS_BATCH].tolist():
+            s = data.synthetics[i]
+            if s.label not in labels:
+                log.debug(f"No originals found for label {s.label}")
                 continue
-        ssim_val = 0.0
-        if best_o_arr is not None:
             try:
-                ssim_val = float(ssim(s_arr, best_o_arr, channel_axis=2))
+                s_arr = _load_pixels(s.path, params)
             except Exception as e:
-                log.warning(f"Failed to compute SSIM: {e}")
-        results.append(Metric(synthpath=s.path, cossim=best_cos, ssim=ssim_val))
-    return MetricsReport(metrics=results)
+                log.warning(f"Failed to load synthetic image {s.path}: {e}")
+                continue
+            groups.setdefault((s.label, s_arr.shape), []).append((i, s_arr))
+        for key, items in groups.items():
+            if key not in index:
+                for i, _ in items:
+                    metrics[i] = Metric(
+                        synthpath=data.synthetics[i].path, cossim=-1.0, ssim=0.0
+                    )
+                continue
+            o_matrix, o_arrs = index[key]
+            s_matrix = np.stack([_vec(s_arr) for _, s_arr in items])
+            best_idx, best_cos = nearest_originals(s_matrix, o_matrix, len(o_matrix))
+            ssim_vals = _ssim_scores(
+                np.stack([s_arr for _, s_arr in items]),
+                lambda js: np.stack([o_arrs[j] for j in js]),
+                best_idx,
+            )
+            for (i, _), cos, ssim_val in zip(items, best_cos, ssim_vals):
+                metrics[i] = Metric(
+                    synthpath=data.synthetics[i].path,
+                    cossim=float(cos),
+                    ssim=float(ssim_val),
+                )
+    report(1.0)
+    return MetricsReport(
+        metrics=[m for m in metrics if m is not None],
+        mode=params.metricsmode,
+        total=len(data.synthetics),
+        truncated=truncated,
+    )
+
+
+def _label_originals(
+    data: SyntheticImages,
+    features: FeatureSet,
+    o_rows: np.ndarray,
+    image_shape: tuple,
+    size: Optional[Tuple[int, int]],
+    work_bytes: int,
+) -> Tuple[Callable[[np.ndarray], np.ndarray], NormalizedRows, Optional[IVFIndex]]:
+
+    def fetch(js: np.ndarray) -> np.ndarray:
+        return features.originals[o_rows[js]].reshape((-1,) + image_shape)
+
+    if size is None:
+        block = max(1, work_bytes // (8 * features.originals.shape[1]))
+        o_matrix = NormalizedRows(features.originals, o_rows, block)
+        index = _label_index(data, features, o_rows, o_matrix, features.shape)
+        return fetch, o_matrix, index
+    o_pixels = _downsample(fetch(np.arange(len(o_rows))), size)
+    o_flat = o_pixels.reshape(len(o_pixels), -1)
+    block = max(1, work_bytes // (8 * o_flat.shape[1]))
+    o_matrix = NormalizedRows(o_flat, np.arange(len(o_flat)), block)
+
+    def fetch_downsampled(js: np.ndarray) -> np.ndarray:
+        return o_pixels[js]
+
+    index = _label_index(data, features, o_rows, o_matrix, o_pixels.shape[1:])
+    return fetch_downsampled, o_matrix, index
+
+
+def _metrics_from_features(
+    data: SyntheticImages,
+    features: FeatureSet,
+    params: ParameterSet,
+    report: Callable[[float], None],
+) -> MetricsReport:
+    shape = features.shape
+    image_shape = shape if shape[2] > 1 else shape[:2]
+    size = _metrics_size(shape, params)
+    original_labels = np.array(features.original_labels)
+    synthetic_labels = np.array([s.label for s in data.synthetics])
+    metrics: List[Optional[Metric]] = [None] * len(data.synthetics)
+    deadline = time.monotonic() + params.metricsbudget if params.metricsbudget else None
+    work_bytes = max(settings.SMOTEMEMORYMB * 1024 * 1024 // 4, 1)
+    order = _metric_order(len(data.synthetics), params)
+    step = METRICS_BATCH if deadline is not None else max(1, len(order))
+    label_originals: Dict[str, tuple] = {}
+    truncated = len(order) < len(data.synthetics)
+    scored = 0
+    for start in range(0, len(order), step):
+        batch = order[start : start + step]
+        labels = sorted(set(synthetic_labels[batch].tolist()))
+        for n, label in enumerate(labels):
+            if _budget_spent(deadline, scored, len(order)):
+                truncated = True
+                break
+            report((start + len(batch) * n / len(labels)) / len(order))
+            if label not in label_originals:
+                o_rows = np.flatnonzero(original_labels == label)
+                label_originals[label] = (
+                    _label_originals(
+                        data, features, o_rows, image_shape, size, work_bytes
+                    )
+                    if len(o_rows)
+                    else None
+                )
+            if label_originals[label] is None:
+                log.debug(f"No originals found for label {label}")
+                continue
+            fetch, o_matrix, index = label_originals[label]
+            s_idx = batch[synthetic_labels[batch] == label]
+            s_pixels = (
+                features.synthetics[features.synthetic_rows[s_idx]]
+                .astype(np.uint8)
+                .reshape((-1,) + image_shape)
+            )
+            if size is not None:
+                s_pixels = _downsample(s_pixels, size)
+            s_flat = s_pixels.reshape(len(s_pixels), -1)
+            if index is None:
+                best_idx, best_cos = nearest_originals(s_flat, o_matrix, o_matrix.block)
+            else:
+                best_idx, best_cos = indexed_originals(
+                    s_flat, o_matrix, index, params.ivfprobes
+                )
+            ssim_vals = _ssim_scores(s_pixels, fetch, best_idx)
+            for i, cos, ssim_val in zip(s_idx, best_cos, ssim_vals):
+                metrics[i] = Metric(
+                    synthpath=data.synthetics[i].path,
+                    cossim=float(cos),
+                    ssim=float(ssim_val),
+                )
+            scored += len(s_idx)
+        if truncated:
+            break
+    report(1.0)
+    return MetricsReport(
+        metrics=[m for m in metrics if m is not None],
+        mode=params.metricsmode,
+        total=len(data.synthetics),
+        truncated=truncated,
+    )
 
 
 def compute_basic_metrics(
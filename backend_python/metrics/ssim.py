@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import Callable, Dict, Tuple
+import numpy as np
+from scipy.ndimage import uniform_filter
+from skimage.util.dtype import dtype_range
+
+WIN_SIZE = 7
+K1 = 0.01
+K2 = 0.03
+COV_NORM = WIN_SIZE**2 / (WIN_SIZE**2 - 1)
+SSIM_CHUNK_BYTES = 16 * 1024 * 1024
+Fetch = Callable[[np.ndarray], np.ndarray]
+
+
+def _filter(x: np.ndarray) -> np.ndarray:
+    return uniform_filter(x, size=(1, WIN_SIZE, WIN_SIZE) + (1,) * (x.ndim - 3))
+
+
+def window_stats(x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    mu = _filter(x)
+    return mu, COV_NORM * (_filter(x * x) - mu * mu)
+
+
+def batched_ssim(
+    synthetics: np.ndarray, fetch: Fetch, matches: np.ndarray
+) -> np.ndarray:
+    if np.issubdtype(synthetics.dtype, np.floating):
+        raise ValueError("SSIM needs an integer image dtype to derive data_range")
+    if min(synthetics.shape[1:3]) < WIN_SIZE:
+        raise ValueError(f"Images are smaller than the {WIN_SIZE}px SSIM window")
+    dmin, dmax = dtype_range[synthetics.dtype.type]
+    c1 = (K1 * (dmax - dmin)) ** 2
+    c2 = (K2 * (dmax - dmin)) ** 2
+    pad = (WIN_SIZE - 1) // 2
+    inner = (slice(None), slice(pad, -pad), slice(pad, -pad))
+    order = np.argsort(matches, kind="stable")
+    rows = max(1, SSIM_CHUNK_BYTES // (80 * synthetics[0].size))
+    scores = np.empty(len(synthetics), dtype=np.float64)
+    stats: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    for start in range(0, len(order), rows):
+        batch = order[start : start + rows]
+        js = matches[batch]
+        missing = np.setdiff1d(js, np.fromiter(stats, dtype=np.int64))
+        if len(missing):
+            y = fetch(missing).astype(np.float64)
+            mu, var = window_stats(y)
+            for n, j in enumerate(missing.tolist()):
+                stats[j] = (y[n], mu[n], var[n])
+        y, uy, vy = (np.stack(s) for s in zip(*(stats[j] for j in js.tolist())))
+        x = synthetics[batch].astype(np.float64)
+        ux, vx = window_stats(x)
+        x *= y
+        vxy = _filter(x)
+        vxy -= ux * uy
+        vxy *= 2 * COV_NORM
+        vxy += c2
+        num = ux * uy
+        num *= 2
+        num += c1
+        num *= vxy
+        vx += vy
+        vx += c2
+        ux **= 2
+        uy **= 2
+        ux += uy
+        ux += c1
+        ux *= vx
+        num /= ux
+        s = num[inner]
+        if s.ndim > 3:
+            scores[batch] = s.mean(axis=(1, 2), dtype=np.float64).mean(axis=1)
+        else:
+            scores[batch] = s.mean(axis=(1, 2), dtype=np.float64)
+        stats = {int(js[-1]): stats[int(js[-1])]}
+    return scores
@@ -4,6 +4,7 @@ import io
 import zipfile
 import json
 import time
+import uuid
 from pathlib import Path
 from PIL import Image
 import numpy as np
@@ -182,6 +183,69 @@ class TestAssetManagement:
         )
         assert get_response.status_code == 404
 
+    def test_registry_cache_stats(self, session, api_config, cleanup_assets):
+        zip_data = create_test_zip({"cached": 2})
+        files = {"file": ("test.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        asset_ids = [asset["id"] for asset in upload_response.json()["assets"]]
+        cleanup_assets.extend(asset_ids)
+
+        for asset_id in asset_ids:
+            session.get(
+                f"{api_config.BASE_URL}/assets/{asset_id}", timeout=api_config.TIMEOUT
+            )
+
+        response = session.get(
+            f"{api_config.BASE_URL}/assets/cache/stats", timeout=api_config.TIMEOUT
+        )
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["hits"] >= 1
+        assert stats["misses"] >= 1
+        assert stats["size"] >= 2
+
+    def test_registry_cache_keeps_own_writes(self, session, api_config, cleanup_assets):
+        files = {"file": ("test.zip", create_test_zip({"own": 1}), "application/zip")}
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        first_id = upload_response.json()["assets"][0]["id"]
+        cleanup_assets.append(first_id)
+        session.get(
+            f"{api_config.BASE_URL}/assets/{first_id}", timeout=api_config.TIMEOUT
+        )
+        before = session.get(
+            f"{api_config.BASE_URL}/assets/cache/stats", timeout=api_config.TIMEOUT
+        ).json()
+
+        files = {"file": ("test.zip", create_test_zip({"own": 2}), "application/zip")}
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        asset_ids = [asset["id"] for asset in upload_response.json()["assets"]]
+        cleanup_assets.extend(asset_ids[1:])
+        for asset_id in asset_ids:
+            response = session.get(
+                f"{api_config.BASE_URL}/assets/{asset_id}", timeout=api_config.TIMEOUT
+            )
+            assert response.status_code == 200
+        session.delete(
+            f"{api_config.BASE_URL}/assets/{asset_ids[0]}", timeout=api_config.TIMEOUT
+        )
+        response = session.get(
+            f"{api_config.BASE_URL}/assets/{asset_ids[0]}", timeout=api_config.TIMEOUT
+        )
+        assert response.status_code == 404
+
+        after = session.get(
+            f"{api_config.BASE_URL}/assets/cache/stats", timeout=api_config.TIMEOUT
+        ).json()
+        assert after["misses"] == before["misses"]
+        assert after["hits"] >= before["hits"] + 3
+
 
 class TestParameters:
     def test_get_and_set_params(self, session, api_config):
@@ -393,6 +457,260 @@ class TestSMOTEAugmentation:
 
         assert response.status_code == 400
 
+    def test_smote_rerun_reuses_synthetics(self, session, api_config, cleanup_assets):
+        params = {"data": {"kneighbors": 3, "targetratio": 1.0, "randomstate": 42}}
+        session.post(
+            f"{api_config.BASE_URL}/params", json=params, timeout=api_config.TIMEOUT
+        )
+
+        suffix = uuid.uuid4().hex[:8]
+        major, minor, grown = (f"{c}_{suffix}" for c in ("major", "minor", "grown"))
+        zip_data = create_test_zip({major: 12, minor: 4, grown: 6})
+        files = {"file": ("rerun.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        uploaded_assets = upload_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in uploaded_assets])
+
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for i in range(2):
+                color = (7 + 40 * i, 201 - 30 * i, 99 + 50 * i)
+                zf.writestr(f"{grown}/extra_{i}.png", create_test_image(color=color))
+        files = {"file": ("extra.zip", zip_buffer.getvalue(), "application/zip")}
+        extra_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        extra_assets = extra_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in extra_assets])
+
+        runs = []
+        for assets in (uploaded_assets, uploaded_assets + extra_assets):
+            smote_request = {
+                "images": [{"asset_id": asset["id"]} for asset in assets],
+                "options": {"horizontal_flip": False, "rotate_deg": None},
+            }
+            response = session.post(
+                f"{api_config.BASE_URL}/augment/smote",
+                json=smote_request,
+                timeout=api_config.TIMEOUT,
+            )
+            assert response.status_code == 200
+            assert response.headers["X-Cache"] == "miss"
+            synthetics: Dict[str, Dict[str, bytes]] = {}
+            with zipfile.ZipFile(io.BytesIO(response.content), "r") as zf:
+                metadata = json.loads(zf.read("augmentation_metadata.json"))
+                for s in metadata["synthetic_images"]:
+                    synthetics.setdefault(s["class"], {})[s["filename"]] = zf.read(
+                        f"{s['class']}/{s['filename']}"
+                    )
+            runs.append(synthetics)
+
+        first, second = runs
+        assert len(first[minor]) == 8
+        assert second[minor] == first[minor]
+        assert len(first[grown]) == 6
+        assert len(second[grown]) == 4
+        assert set(second[grown]) <= set(first[grown])
+        for name, data in second[grown].items():
+            assert data == first[grown][name]
+
+    def test_smote_identical_request_is_cached(
+        self, session, api_config, cleanup_assets
+    ):
+        params = {"data": {"kneighbors": 3, "targetratio": 1.0, "randomstate": 7}}
+        session.post(
+            f"{api_config.BASE_URL}/params", json=params, timeout=api_config.TIMEOUT
+        )
+
+        suffix = uuid.uuid4().hex[:8]
+        zip_data = create_test_zip({f"major_{suffix}": 10, f"minor_{suffix}": 4})
+        files = {"file": ("cached.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        uploaded_assets = upload_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in uploaded_assets])
+
+        smote_request = {
+            "images": [{"asset_id": asset["id"]} for asset in uploaded_assets],
+            "options": {"horizontal_flip": False, "rotate_deg": None},
+        }
+
+        responses = []
+        for _ in range(2):
+            response = session.post(
+                f"{api_config.BASE_URL}/augment/smote",
+                json=smote_request,
+                timeout=api_config.TIMEOUT,
+            )
+            assert response.status_code == 200
+            responses.append(response)
+
+        assert responses[0].headers["X-Cache"] == "miss"
+        assert responses[1].headers["X-Cache"] == "hit"
+        assert responses[0].content == responses[1].content
+
+    def test_smote_sampled_quality_metrics(self, session, api_config, cleanup_assets):
+        params = {
+            "data": {
+                "kneighbors": 3,
+                "targetratio": 1.0,
+                "randomstate": 42,
+                "metricsmode": "sampled",
+                "metricssample": 4,
+            }
+        }
+        session.post(
+            f"{api_config.BASE_URL}/params", json=params, timeout=api_config.TIMEOUT
+        )
+
+        suffix = uuid.uuid4().hex[:8]
+        zip_data = create_test_zip({f"major_{suffix}": 12, f"minor_{suffix}": 4})
+        files = {"file": ("sampled.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        uploaded_assets = upload_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in uploaded_assets])
+
+        smote_request = {
+            "images": [{"asset_id": asset["id"]} for asset in uploaded_assets],
+            "options": {"horizontal_flip": False, "rotate_deg": None},
+        }
+
+        response = session.post(
+            f"{api_config.BASE_URL}/augment/smote",
+            json=smote_request,
+            timeout=api_config.TIMEOUT,
+        )
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.content), "r") as zf:
+            metadata = json.loads(zf.read("augmentation_metadata.json"))
+
+        metrics = metadata["metrics"]
+        sampling = metrics["quality_sampling"]
+        assert metadata["count"] == 8
+        assert len(metrics["quality_metrics"]) == 4
+        assert sampling["mode"] == "sampled"
+        assert sampling["evaluated"] == 4
+        assert sampling["total"] == 8
+        low, high = sampling["ssim_ci"]
+        assert low <= metrics["average_quality"]["ssim"] <= high
+
+    def test_smote_quality_metrics_budget(self, session, api_config, cleanup_assets):
+        params = {
+            "data": {
+                "kneighbors": 3,
+                "targetratio": 1.0,
+                "randomstate": 42,
+                "metricsbudget": 0.001,
+            }
+        }
+        session.post(
+            f"{api_config.BASE_URL}/params", json=params, timeout=api_config.TIMEOUT
+        )
+
+        suffix = uuid.uuid4().hex[:8]
+        zip_data = create_test_zip(
+            {f"major_{suffix}": 12, f"first_{suffix}": 4, f"second_{suffix}": 4}
+        )
+        files = {"file": ("budget.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        uploaded_assets = upload_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in uploaded_assets])
+
+        smote_request = {
+            "images": [{"asset_id": asset["id"]} for asset in uploaded_assets],
+            "options": {"horizontal_flip": False, "rotate_deg": None},
+        }
+
+        response = session.post(
+            f"{api_config.BASE_URL}/augment/smote",
+            json=smote_request,
+            timeout=api_config.TIMEOUT,
+        )
+        assert response.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(response.content), "r") as zf:
+            metadata = json.loads(zf.read("augmentation_metadata.json"))
+
+        metrics = metadata["metrics"]
+        sampling = metrics["quality_sampling"]
+        assert metadata["count"] == 16
+        assert sampling["mode"] == "full"
+        assert sampling["total"] == 16
+        assert 0 < sampling["evaluated"] < 16
+        assert len(metrics["quality_metrics"]) == sampling["evaluated"]
+
+
+class TestAugmentationJobs:
+    def test_smote_job_lifecycle(self, session, api_config, cleanup_assets):
+        zip_data = create_test_zip({"majority": 12, "minority": 4})
+        files = {"file": ("test.zip", zip_data, "application/zip")}
+
+        upload_response = session.post(
+            f"{api_config.BASE_URL}/upload/zip", files=files, timeout=api_config.TIMEOUT
+        )
+        uploaded_assets = upload_response.json()["assets"]
+        cleanup_assets.extend([asset["id"] for asset in uploaded_assets])
+
+        smote_request = {
+            "images": [{"asset_id": asset["id"]} for asset in uploaded_assets],
+            "options": {"horizontal_flip": False, "rotate_deg": None},
+        }
+
+        response = session.post(
+            f"{api_config.BASE_URL}/augment/jobs",
+            json=smote_request,
+            timeout=api_config.TIMEOUT,
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        deadline = time.time() + api_config.TIMEOUT
+        status = None
+        while time.time() < deadline:
+            status = session.get(
+                f"{api_config.BASE_URL}/augment/jobs/{job_id}",
+                timeout=api_config.TIMEOUT,
+            ).json()
+            if status["status"] in ("done", "failed"):
+                break
+            time.sleep(0.5)
+
+        assert status["status"] == "done"
+        assert status["progress"] == 100.0
+        assert status["count"] > 0
+        assert status["expires_at"] > status["finished_at"]
+
+        result = session.get(
+            f"{api_config.BASE_URL}/augment/jobs/{job_id}/result",
+            timeout=api_config.TIMEOUT,
+        )
+        assert result.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(result.content), "r") as zf:
+            metadata = json.loads(zf.read("augmentation_metadata.json"))
+            assert metadata["count"] == status["count"]
+
+        response = session.get(
+            f"{api_config.BASE_URL}/augment/jobs/{job_id}", timeout=api_config.TIMEOUT
+        )
+        assert response.status_code == 200
+        assert response.json()["expires_at"] == status["expires_at"]
+
+    def test_unknown_job(self, session, api_config):
+        response = session.get(
+            f"{api_config.BASE_URL}/augment/jobs/not-a-job", timeout=api_config.TIMEOUT
+        )
+        assert response.status_code == 404
+
 
 class TestIntegration:
     def test_complete_workflow(self, session, api_config, cleanup_assets):
@@ -7,6 +7,7 @@ from config import settings
 from upload.schemas import UploadResult, AssetOut
 from upload.service import ingest_zip
 from auth import verify_api_key
+from executor import cpu_executor
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 api_key_header = APIKeyHeader(name=settings.API_KEY_HEADER, auto_error=False)
@@ -20,7 +21,7 @@ class UploadResponse(UploadResult):
 async def upload_zip(
     file: UploadFile = File(...), key: Annotated[str, Security(verify_api_key)] = None
 ) -> UploadResult:
-    created = ingest_zip(file)
+    created = await cpu_executor.run("upload", ingest_zip, file)
     assets: List[AssetOut] = []
     for asset_id, filename, label in created:
         assets.append(
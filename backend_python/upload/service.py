@@ -1,14 +1,21 @@
 from __future__ import annotations
-import io
+import hashlib
 import os
 import tempfile
 import zipfile
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from pathlib import Path
 from typing import List, Tuple
 import logging
 from fastapi import HTTPException, UploadFile
 from PIL import Image
-from assets.registry import registry
+from assets.registry import PendingFile, registry
 from config import settings
 
 log = logging.getLogger(__name__)
@@ -17,6 +24,7 @@ MAX_IMAGE_PIXELS = 50_000_000
 MINIMUM_IMAGE_RESOLUTION = settings.MINIMUM_IMAGE_RESOLUTION
 MAXIMUM_IMAGE_DIMENSION = settings.MAXIMUM_IMAGE_DIMENSION
 MAXIMUM_IMAGE_PIXELS = settings.MAXIMUM_IMAGE_PIXELS
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 
 def is_allowed_image(filename: str) -> bool:
@@ -24,41 +32,104 @@ def is_allowed_image(filename: str) -> bool:
     return ext in settings.ALLOWEDIMAGEEXTS
 
 
-def validate_and_save_temp(img_bytes: bytes, original_filename: str) -> Path:
+def sniff_image_format(head: bytes) -> str | None:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def stream_member_to_temp(
+    zf: zipfile.ZipFile, info: zipfile.ZipInfo, original_filename: str
+) -> Tuple[Path, str]:
+    max_bytes = settings.UPLOADMAXFILEMB * 1024 * 1024
+    if info.file_size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {original_filename} exceeds {settings.UPLOADMAXFILEMB} MB",
+        )
+    tmp_dir = settings.DATAPATH / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(
+        delete=False, dir=str(tmp_dir), prefix="upload_", suffix=".tmp"
+    )
+    h = hashlib.sha256()
+    written = 0
+    try:
+        with zf.open(info, "r") as fp:
+            while True:
+                chunk = fp.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if written == 0 and sniff_image_format(chunk[:16]) is None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Invalid or corrupted image {original_filename} - "
+                        "unrecognized file signature",
+                    )
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File {original_filename} exceeds "
+                        f"{settings.UPLOADMAXFILEMB} MB",
+                    )
+                h.update(chunk)
+                tmp.write(chunk)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        tmp.close()
+        return Path(tmp.name), h.hexdigest()
+    except Exception as e:
+        tmp.close()
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
+        if isinstance(e, OSError):
+            raise HTTPException(
+                status_code=500, detail=f"Failed to save file: {str(e)}"
+            )
+        raise
+
+
+def validate_image_file(path: Path, original_filename: str) -> None:
     try:
-        with Image.open(io.BytesIO(img_bytes)) as im:
-            im.verify()
-        
-        with Image.open(io.BytesIO(img_bytes)) as im:
+        with Image.open(path) as im:
             if im.format and im.format.lower() not in ("jpeg", "jpg", "png", "webp"):
                 raise HTTPException(
                     status_code=400,
                     detail=f"Unsupported image format for {original_filename}: {im.format}",
                 )
-            
+
             width, height = im.size
-            
+
             if width > MAXIMUM_IMAGE_DIMENSION or height > MAXIMUM_IMAGE_DIMENSION:
                 raise HTTPException(
                     status_code=413,
                     detail=f"Image dimensions too large ({width}x{height}). "
                     f"Maximum dimension: {MAXIMUM_IMAGE_DIMENSION}px",
                 )
-            
+
             if width * height > MAXIMUM_IMAGE_PIXELS:
                 raise HTTPException(
                     status_code=413,
                     detail=f"Image resolution too high ({width * height} pixels). "
                     f"Maximum: {MAXIMUM_IMAGE_PIXELS} pixels",
                 )
-            
+
             if width < 32 or height < 32:
                 raise HTTPException(
                     status_code=400,
                     detail=f"Image resolution too low ({width}x{height}). "
                     f"Minimum resolution: 32x32 pixels",
                 )
-    
+
+            im.load()
+
     except HTTPException:
         raise
     except Exception as e:
@@ -67,26 +138,6 @@ def validate_and_save_temp(img_bytes: bytes, original_filename: str) -> Path:
             status_code=400,
             detail=f"Invalid or corrupted image {original_filename} - {str(e)}",
         )
-    
-    tmp_dir = settings.DATAPATH / "tmp"
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    
-    tmp = tempfile.NamedTemporaryFile(
-        delete=False, dir=str(tmp_dir), prefix="upload_", suffix=".tmp"
-    )
-    try:
-        tmp.write(img_bytes)
-        tmp.flush()
-        os.fsync(tmp.fileno())
-        tmp.close()
-        return Path(tmp.name)
-    except Exception as e:
-        try:
-            os.unlink(tmp.name)
-        except OSError:
-            pass
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-
 
 
 def validate_zip_limits(zf: zipfile.ZipFile) -> None:
@@ -130,12 +181,43 @@ def safe_member_name(member: zipfile.ZipInfo) -> str:
     return normalized
 
 
+def check_image_file(path: str, original_filename: str) -> Tuple[int, str] | None:
+    try:
+        validate_image_file(Path(path), original_filename)
+    except HTTPException as e:
+        return e.status_code, e.detail
+    return None
+
+
+def make_validation_pool() -> Executor:
+    workers = max(1, settings.UPLOADWORKERS)
+    if settings.UPLOADEXECUTOR == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if settings.UPLOADEXECUTOR == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+    raise ValueError(f"Unknown upload executor: {settings.UPLOADEXECUTOR}")
+
+
+validation_pool = make_validation_pool()
+
+
+def collect_checks(checks: List[Future], start: int, block: bool) -> int:
+    while start < len(checks) and (block or checks[start].done()):
+        failure = checks[start].result()
+        if failure is not None:
+            raise HTTPException(status_code=failure[0], detail=failure[1])
+        start += 1
+    return start
+
+
 def ingest_zip(file: UploadFile) -> List[Tuple[str, str, str]]:
     file.file.seek(0, os.SEEK_SET)
+    pending: List[PendingFile] = []
+    checks: List[Future] = []
     try:
         with zipfile.ZipFile(file.file) as zf:
             validate_zip_limits(zf)
-            created: List[Tuple[str, str, str]] = []
+            checked = 0
             for info in zf.infolist():
                 if info.is_dir():
                     continue
@@ -154,22 +236,27 @@ def ingest_zip(file: UploadFile) -> List[Tuple[str, str, str]]:
                     log.debug(f"Skipping non-image file: {filename}")
                     continue
                 try:
-                    with zf.open(info, "r") as fp:
-                        data = fp.read()
-                    tmppath = validate_and_save_temp(data, filename)
-                    asset = registry.add_file(
-                        tmppath, original_filename=filename, label=class_label
-                    )
-                    created.append((asset.id, asset.filename, class_label))
+                    tmppath, sha256 = stream_member_to_temp(zf, info, filename)
                 except HTTPException:
                     raise
                 except Exception as e:
                     log.error(f"Failed to process {filename}: {e}")
                     continue
-            if not created:
+                pending.append(
+                    PendingFile(tmppath, filename, class_label, sha256=sha256)
+                )
+                checks.append(
+                    validation_pool.submit(check_image_file, str(tmppath), filename)
+                )
+                checked = collect_checks(checks, checked, block=False)
+            collect_checks(checks, checked, block=True)
+            if not pending:
                 raise HTTPException(
                     status_code=400, detail="No valid images found in archive"
                 )
+            assets = registry.add_files(pending)
+            pending = []
+            created = [(a.id, a.filename, a.label) for a in assets]
             log.info(f"Ingested {len(created)} images from ZIP with class labels")
             return created
     except zipfile.BadZipFile:
@@ -179,3 +266,7 @@ def ingest_zip(file: UploadFile) -> List[Tuple[str, str, str]]:
     except Exception as e:
         log.exception(f"Unexpected error during ZIP ingestion: {e}")
         raise HTTPException(status_code=500, detail="Failed to process ZIP file")
+    finally:
+        wait([fut for fut in checks if not fut.cancel()])
+        for item in pending:
+            item.source.unlink(missing_ok=True)